@@ -0,0 +1,183 @@
+"""
+Admission control for summarization requests.
+
+Every upload that needs summarizing asks AdmissionController for a ticket before any work
+starts, and returns it when its summary is done. A ticket is granted while fewer than
+max_concurrent tickets are out and the estimated cost of the running work stays within the
+limits, in pages and document tokens. Otherwise the request waits, first in first out, in a
+queue of at most max_waiting requests for at most wait_timeout seconds. A request that finds
+the queue full, times out, or may not wait at all gets Overloaded, with the reason
+'queue_full', 'timeout' or 'busy', which the app answers with 503 and Retry-After.
+
+Limits apply per process; under gunicorn each web worker admits its own share.
+"""
+import math
+import threading
+import time
+import zipfile
+from collections import deque
+from io import BytesIO
+
+import metrics
+
+
+DEFAULT_MAX_CONCURRENT = 4
+DEFAULT_MAX_WAITING = 16
+DEFAULT_WAIT_TIMEOUT = 10.0
+DEFAULT_RETRY_AFTER = 5
+CHARS_PER_TOKEN = 4
+TOKENS_PER_PAGE = 600
+DOCX_MARKUP_RATIO = 4  # Bytes of document.xml per character of text, roughly
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def estimate_cost(data: bytes, extension: str) -> dict[str, int]:
+    """
+    Estimates the cost of summarizing an upload from its size, without extracting its text.
+    PDFs are counted by their pages; TXT and DOCX files by their characters, converted to
+    tokens and pages at CHARS_PER_TOKEN and TOKENS_PER_PAGE.
+
+    :param data: The uploaded document.
+    :type data: bytes
+    :param extension: The file extension of the upload.
+    :type extension: str
+    :return: The estimated 'pages' and 'tokens' of the document.
+    :rtype: dict[str, int]
+    """
+    if extension == 'pdf':
+        import fitz  # Not on the import path of the app
+
+        try:
+            with fitz.open(stream=data, filetype='pdf') as document:
+                pages = document.page_count
+            return {'pages': pages, 'tokens': pages * TOKENS_PER_PAGE}
+        except RuntimeError:
+            pass  # Unreadable; the summarization reports the error, estimate from the size
+    if extension == 'docx':
+        try:
+            with zipfile.ZipFile(BytesIO(data)) as archive:
+                characters = archive.getinfo('word/document.xml').file_size // DOCX_MARKUP_RATIO
+        except (KeyError, zipfile.BadZipFile):
+            characters = len(data)
+    else:
+        characters = len(data)
+    tokens = characters // CHARS_PER_TOKEN
+    return {'pages': max(1, math.ceil(tokens / TOKENS_PER_PAGE)), 'tokens': tokens}
+
+
+class Ticket:
+    __slots__ = ('cost', 'released')
+
+    def __init__(self, cost):
+        self.cost = cost
+        self.released = False
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT, max_waiting: int = DEFAULT_MAX_WAITING,
+                 limits: dict[str, int] | None = None, wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+                 retry_after: int = DEFAULT_RETRY_AFTER):
+        """
+        :param max_concurrent: Tickets that may be out at the same time.
+        :type max_concurrent: int
+        :param max_waiting: Requests that may wait for a ticket; further requests are rejected.
+        :type max_waiting: int
+        :param limits: The maximum total cost of the admitted work per unit, e.g.
+                       {'pages': 500}. A request that alone exceeds a limit is admitted only
+                       when nothing else is running.
+        :type limits: dict[str, int] | None
+        :param wait_timeout: Seconds a request waits for a ticket before it is rejected.
+        :type wait_timeout: float
+        :param retry_after: Seconds rejected clients are told to wait before retrying.
+        :type retry_after: int
+        """
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.limits = dict(limits or {})
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self.__condition = threading.Condition()
+        self.__waiting = deque()
+        self.__running = 0
+        self.__in_use = dict.fromkeys(self.limits, 0)
+
+    def __fits(self, cost):
+        if self.__running == 0:
+            return True
+        if self.__running >= self.max_concurrent:
+            return False
+        return all(self.__in_use[unit] + cost.get(unit, 0) <= limit for unit, limit in self.limits.items())
+
+    def __reject(self, reason):
+        metrics.ADMISSION_REJECTIONS.inc(reason)
+        raise Overloaded(reason, self.retry_after)
+
+    def acquire(self, cost: dict[str, int] | None = None, wait_timeout: float | None = None) -> Ticket:
+        """
+        Waits for capacity for work of the given cost and takes it.
+
+        :param cost: The estimated cost of the work, see estimate_cost.
+        :type cost: dict[str, int] | None
+        :param wait_timeout: Seconds to wait instead of the wait_timeout of the controller; 0
+                             takes capacity only if it is free right away.
+        :type wait_timeout: float | None
+        :return: The ticket to pass to release when the work is done.
+        :rtype: Ticket
+        :raises Overloaded: If there is no capacity and wait_timeout is 0, the wait queue is
+                            full, or the wait timed out.
+        """
+        cost = cost or {}
+        if wait_timeout is None:
+            wait_timeout = self.wait_timeout
+        started = time.monotonic()
+        with self.__condition:
+            if self.__waiting or not self.__fits(cost):
+                if wait_timeout <= 0:
+                    self.__reject('busy')
+                if len(self.__waiting) >= self.max_waiting:
+                    self.__reject('queue_full')
+                waiter = object()
+                self.__waiting.append(waiter)
+                metrics.ADMISSION_QUEUE_DEPTH.set(len(self.__waiting))
+                try:
+                    deadline = started + wait_timeout
+                    while self.__waiting[0] is not waiter or not self.__fits(cost):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.__reject('timeout')
+                        self.__condition.wait(remaining)
+                finally:
+                    self.__waiting.remove(waiter)
+                    metrics.ADMISSION_QUEUE_DEPTH.set(len(self.__waiting))
+                    self.__condition.notify_all()  # The next waiter may be at the head now
+            self.__running += 1
+            for unit in self.__in_use:
+                self.__in_use[unit] += cost.get(unit, 0)
+            self.__report()
+        metrics.ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started)
+        return Ticket(cost)
+
+    def release(self, ticket: Ticket) -> None:
+        """
+        Returns the capacity of a ticket. Releasing a ticket again does nothing.
+        """
+        with self.__condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.__running -= 1
+            for unit in self.__in_use:
+                self.__in_use[unit] -= ticket.cost.get(unit, 0)
+            self.__report()
+            self.__condition.notify_all()
+
+    def __report(self):
+        metrics.ADMISSION_RUNNING.set(self.__running)
+        for unit, value in self.__in_use.items():
+            metrics.ADMISSION_COST_IN_USE.set(value, unit)
@@ -1,17 +1,157 @@
-from flask import Flask, render_template, request, jsonify, redirect
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, stream_with_context
+from markupsafe import escape
 from werkzeug.utils import secure_filename
+import json
 import os
-import sqlite3 as sql
-from summarize import Summarizer
-from summ import generate_summary
-import fitz
+import threading
+import time
+import summ
+from admission import (DEFAULT_MAX_CONCURRENT, DEFAULT_MAX_WAITING, DEFAULT_RETRY_AFTER, DEFAULT_WAIT_TIMEOUT,
+                       AdmissionController, Overloaded, estimate_cost)
+from summ import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_TOKENS, DEFAULT_MAX_DEPTH, ckpt
+from summary_cache import PIPELINE_VERSION, SummaryCache, document_key
+from jobs import DEFAULT_MAX_ATTEMPTS, DEFAULT_MAX_WORKERS, JobQueue, claim_ownership
+import database
+import metrics
+import nlp_resources
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['SECRET_KEY'] = 'supersecretkey'
+app.config['SUMMARY_CHUNK_TOKENS'] = DEFAULT_CHUNK_TOKENS
+app.config['SUMMARY_CHUNK_OVERLAP'] = DEFAULT_CHUNK_OVERLAP
+app.config['SUMMARY_MAX_DEPTH'] = DEFAULT_MAX_DEPTH
+app.config['SUMMARY_TOKEN_BUDGET'] = DEFAULT_CHUNK_TOKENS  # None keeps every sentence above 1.2x the average
+app.config['JOB_WORKERS'] = int(os.environ.get('SARA_JOB_WORKERS', DEFAULT_MAX_WORKERS))  # Per web worker
+app.config['JOB_MAX_ATTEMPTS'] = DEFAULT_MAX_ATTEMPTS
+app.config['SAVE_UPLOADS'] = False
+app.config['PDF_WORKERS'] = 0
+app.config['PRELOAD_MODEL'] = os.environ.get('SARA_PRELOAD', '0') == '1'
+app.config['STREAM_SUMMARIES'] = os.environ.get('SARA_STREAM', '0') == '1'  # Uploads bypass the job pool
+app.config['ADMISSION_MAX_CONCURRENT'] = int(os.environ.get('SARA_MAX_CONCURRENT', DEFAULT_MAX_CONCURRENT))
+app.config['ADMISSION_MAX_WAITING'] = int(os.environ.get('SARA_MAX_WAITING', DEFAULT_MAX_WAITING))
+app.config['ADMISSION_WAIT_TIMEOUT'] = DEFAULT_WAIT_TIMEOUT
+app.config['ADMISSION_MAX_PAGES'] = 400  # Estimated pages of all admitted uploads together
+app.config['ADMISSION_MAX_TOKENS'] = 240000
+app.config['RETRY_AFTER'] = DEFAULT_RETRY_AFTER
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx'}
+SEARCH_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+DATABASE = database.DEFAULT_DATABASE
+
+summary_cache = SummaryCache(DATABASE)
+job_queue = JobQueue(DATABASE, max_workers=app.config['JOB_WORKERS'], max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+                     start_method='fork' if app.config['PRELOAD_MODEL'] else 'spawn')
+admission = AdmissionController(max_concurrent=app.config['ADMISSION_MAX_CONCURRENT'],
+                                max_waiting=app.config['ADMISSION_MAX_WAITING'],
+                                limits={'pages': app.config['ADMISSION_MAX_PAGES'],
+                                        'tokens': app.config['ADMISSION_MAX_TOKENS']},
+                                wait_timeout=app.config['ADMISSION_WAIT_TIMEOUT'],
+                                retry_after=app.config['RETRY_AFTER'])
+ready = threading.Event()
+_warm_up_lock = threading.Lock()
+_warm_up_pid = None
+
+
+def preload():
+    """
+    Loads the NLTK resources and the model without running it, so that processes forked
+    afterwards share them. Nothing is generated, as torch cannot generate in a forked child
+    once its parent has.
+    """
+    nlp_resources.preload()
+    summ.load()
+
+
+def warm_up():
+    """
+    Loads the NLTK resources and checks the database. With PRELOAD_MODEL the model is loaded
+    and run once as well.
+    """
+    nlp_resources.preload()
+    database.get_connection(DATABASE)
+    if app.config['PRELOAD_MODEL']:
+        summ.warm_up()
+    ready.set()
+
+
+def start_warm_up():
+    """
+    Runs warm_up on a background thread of this process, unless it already ran. Threads do
+    not survive fork, so every worker starts its own: gunicorn.conf.py does it right after
+    forking, and other servers on their first request.
+    """
+    global _warm_up_pid
+    with _warm_up_lock:
+        if ready.is_set() or _warm_up_pid == os.getpid():
+            return
+        _warm_up_pid = os.getpid()
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+
+if app.config['PRELOAD_MODEL']:
+    preload()  # Before gunicorn forks its workers when preload_app is set
+
+
+def start_server():
+    """
+    Runs once per server start, in the process that starts the web workers: claims the owner
+    of the jobs this server submits and fails the jobs of earlier servers that are gone.
+    gunicorn.conf.py calls it when the master is ready.
+    """
+    claim_ownership(DATABASE)
+    job_queue.fail_interrupted()
+
+
+def start_worker():
+    """
+    Runs in every web worker right after it is forked, before it starts any thread. With
+    PRELOAD_MODEL the job pool forks its workers now, while that is still safe, and the
+    warm-up generation then runs on a thread of the web worker.
+    """
+    if app.config['PRELOAD_MODEL']:
+        job_queue.start()
+    start_warm_up()
+
+
+@app.before_request
+def warm_up_worker():
+    start_warm_up()
+
+
+@app.before_request
+def start_metrics():
+    metrics.REGISTRY.start_writer()
+    g.started = time.perf_counter()
+    g.trace, g.trace_token = metrics.start_trace()
+    metrics.REQUESTS_IN_FLIGHT.inc(request.endpoint)
+
+
+@app.after_request
+def record_metrics(response):
+    elapsed = time.perf_counter() - g.started
+    metrics.observe(g.trace)
+    metrics.REQUEST_SECONDS.observe(elapsed, request.endpoint)
+    metrics.REQUESTS.inc(request.endpoint, response.status_code)
+    stages = [*g.trace.stages, *g.get('job_timings', ()), ('total', elapsed)]
+    response.headers['Server-Timing'] = metrics.server_timing(stages)
+    return response
+
+
+@app.teardown_request
+def end_metrics(exc):
+    token = g.pop('trace_token', None)  # Streamed responses tear down twice
+    if token is not None:
+        metrics.end_trace(token)
+        metrics.REQUESTS_IN_FLIGHT.dec(request.endpoint)
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    return jsonify({'error': 'The server is busy, please retry later', 'reason': e.reason}), 503, \
+        {'Retry-After': str(e.retry_after)}
 
 
 def allowed_file(filename):
@@ -22,67 +162,224 @@ def allowed_file(filename):
 @app.route('/explore_sara', methods=['GET', 'POST'])
 def explore_sara():
     summary = None
+    job_id = None
     if request.method == 'POST':
         if 'document' not in request.files:
             return redirect(request.url)
         file = request.files['document']
         if file.filename == '':
             return redirect(request.url)
+        if not allowed_file(file.filename):
+            return jsonify({'error': 'Unsupported file type'}), 415
         if file:
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            summary = summarize_document(file_path)
-            save_article_to_db(filename, summary)
+            extension = file.filename.rsplit('.', 1)[1].lower()
+            with metrics.stage('read'):
+                data = file.read()
+            with metrics.stage('cache'):
+                key = document_key(data, summary_version())
+                summary = summary_cache.get(key)
+            if summary is not None:
+                save_article_to_db(filename, summary)
+            else:
+                ticket = admit(data, extension)
+                try:
+                    if app.config['SAVE_UPLOADS']:
+                        with metrics.stage('save_upload'), \
+                                open(os.path.join(app.config['UPLOAD_FOLDER'], filename), 'wb') as upload:
+                            upload.write(data)
+                    with metrics.stage('enqueue'):
+                        job_id = job_queue.submit(filename, data, extension, key,
+                                                  {**summary_settings(), 'pdf_workers': app.config['PDF_WORKERS']},
+                                                  on_done=lambda: admission.release(ticket))
+                except Exception:
+                    admission.release(ticket)
+                    raise
+            if request.accept_mimetypes.best == 'application/json':
+                if job_id is not None:
+                    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+                return jsonify({'article_id': filename, 'summary': summary})
     articles = get_recent_articles()
-    return render_template('explore_sara.html', summary=summary, articles=articles)
+    return render_template('explore_sara.html', summary=summary, job_id=job_id, articles=articles,
+                           stream_summaries=app.config['STREAM_SUMMARIES'])
+
+
+@app.route('/explore_sara/stream', methods=['POST'])
+def explore_sara_stream():
+    """
+    Summarizes an upload in this process and streams the result as server-sent events:
+    'progress' after extraction and after the extractive stage, 'token' for every piece of the
+    summary as the model decodes it, then 'done' with the stored article, or 'error'. The
+    response starts before any work is done, so the first byte does not wait for the model.
+
+    The upload does not go through the job pool, so this worker is busy until the summary is
+    done and, without an inference server, holds its own copy of the model. The endpoint is
+    therefore off unless STREAM_SUMMARIES is set.
+    """
+    if not app.config['STREAM_SUMMARIES']:
+        return jsonify({'error': 'Streaming is disabled'}), 404
+    file = request.files.get('document')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No document uploaded'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Unsupported file type'}), 415
+    filename = secure_filename(file.filename)
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    with metrics.stage('read'):
+        data = file.read()
+    with metrics.stage('cache'):
+        key = document_key(data, summary_version())
+        cached = summary_cache.get(key)
+    settings = {**summary_settings(), 'pdf_workers': app.config['PDF_WORKERS']}
+    ticket = admit(data, extension) if cached is None else None
+
+    def events():
+        from pipeline import EmptySummary, stream_document
+
+        yield server_sent_event('progress', {'stage': 'upload', 'article_id': filename})
+        summary = cached
+        with metrics.trace() as trace:  # The request trace was observed when the response started
+            try:
+                if summary is None:
+                    pieces = []
+                    for event, value in stream_document(data, extension, **settings):
+                        if event == 'token':
+                            pieces.append(value)
+                            value = {'text': value}
+                        yield server_sent_event(event, value)
+                    summary = "".join(pieces).strip()
+                    summary_cache.put(key, summary)
+                save_article_to_db(filename, summary)
+            except EmptySummary as e:
+                yield server_sent_event('error', {'error': str(e)})
+                return
+            except Exception:
+                app.logger.exception('Streaming the summary of %s failed', filename)
+                yield server_sent_event('error', {'error': 'The document could not be summarized'})
+                return
+            finally:
+                metrics.observe(trace)
+        yield server_sent_event('done', {'article_id': filename, 'summary': summary})
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if ticket is not None:
+        response.call_on_close(lambda: admission.release(ticket))  # Also when the client disconnects
+    return response
+
+
+@app.route('/jobs/<string:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['timings']:
+        g.job_timings = json.loads(job['timings'])  # The job's stages, added to Server-Timing
+    return jsonify({'job_id': job['id'], 'status': job['status'], 'attempts': job['attempts'],
+                    'article_id': job['filename'], 'summary': job['summary'], 'error': job['error']})
 
 
 @app.route('/summary/<string:article_id>', methods=['GET'])
 def get_summary(article_id):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT summary FROM articles WHERE filename = ?', (article_id,))
-    result = c.fetchone()[0]
-    conn.close()
-    if result:
+    result = database.get_article_summary(article_id, DATABASE)
+    if result is not None:
         return jsonify({'summary': result})
     else:
         return jsonify({'error': 'Article not found'}), 404
 
 
-def summarize_document(file_path):
-    summarizer = Summarizer("turkish-english-summarizer")
-    document = fitz.open(file_path)
-    text = ""
-    for page_num in range(document.page_count):
-        page = document.load_page(page_num)
-        text += page.get_text("text")
-    summarized_text = summarizer.summarize(text)
-    return generate_summary(summarized_text)
+@app.route('/search', methods=['GET'])
+def search():
+    """
+    Full-text search over the stored articles, best match first. Query parameters: q, page
+    (from 1) and per_page. Snippets are HTML with the matched terms in <mark> elements.
+    """
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', SEARCH_PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+    if page < 1 or per_page < 1:
+        return jsonify({'error': 'page and per_page must be positive'}), 400
+    with metrics.stage('search'):
+        rows = database.search_articles(query, limit=per_page + 1, offset=(page - 1) * per_page, path=DATABASE)
+    results = [{'id': row['id'], 'article_id': row['filename'], 'snippet': highlight(row['snippet']),
+                'score': row['score']} for row in rows[:per_page]]
+    return jsonify({'query': query, 'page': page, 'per_page': per_page, 'results': results,
+                    'next_page': page + 1 if len(rows) > per_page else None})
+
+
+@app.route('/articles', methods=['GET'])
+def list_articles():
+    """
+    Lists the stored articles, newest first. Pass the next_before value of a response as the
+    before parameter to get the next page.
+    """
+    limit = min(request.args.get('limit', database.RECENT_ARTICLES_LIMIT, type=int), MAX_PAGE_SIZE)
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    rows = database.get_recent_articles(limit, DATABASE, before_id=request.args.get('before', type=int))
+    return jsonify({'articles': [{'id': row['id'], 'article_id': row['filename'], 'summary': row['summary']}
+                                 for row in rows],
+                    'next_before': rows[-1]['id'] if len(rows) == limit else None})
+
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    if not ready.is_set():
+        return jsonify({'ready': False}), 503
+    return jsonify({'ready': True, 'model_loaded': summ.is_loaded(), 'inference_server': summ.inference_socket})
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(summary_cache.stats())
+
+
+def admit(data, extension):
+    """
+    Waits for the admission controller to take an upload that needs summarizing. A server
+    that handles one request at a time per process does not wait, as waiting would block
+    every other request of the worker, including /jobs polling and /ready.
+
+    :raises Overloaded: If the server is too busy; answered with 503 and Retry-After.
+    """
+    wait_timeout = None if request.environ.get('wsgi.multithread') else 0
+    with metrics.stage('admission'):
+        return admission.acquire(estimate_cost(data, extension), wait_timeout=wait_timeout)
 
 
 def save_article_to_db(filename, summary):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO articles (filename, summary) VALUES (?, ?)', (filename, summary))
-    conn.commit()
-    conn.close()
+    with metrics.stage('save_article'):
+        database.save_article(filename, summary, DATABASE)
+
+
+def highlight(snippet):
+    return str(escape(snippet)).replace(database.SNIPPET_START, '<mark>').replace(database.SNIPPET_END, '</mark>')
+
+
+def server_sent_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
 
 
 def get_recent_articles():
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT filename, summary FROM articles ORDER BY id DESC LIMIT 5')
-    articles = c.fetchall()
-    conn.close()
-    return articles
+    return database.get_recent_articles(path=DATABASE)
+
+
+def summary_settings():
+    return {'chunk_tokens': app.config['SUMMARY_CHUNK_TOKENS'],
+            'overlap_tokens': app.config['SUMMARY_CHUNK_OVERLAP'],
+            'max_depth': app.config['SUMMARY_MAX_DEPTH'],
+            'token_budget': app.config['SUMMARY_TOKEN_BUDGET']}
 
 
-def get_db_connection():
-    conn = sql.connect('db/db.sqlite3')
-    conn.row_factory = sql.Row
-    return conn
+def summary_version():
+    # Backends differ in their output, so summaries of one are never served for another
+    model = (ckpt, summ.backend, summ.onnx_dir if summ.backend == 'onnx' else '')
+    return ':'.join(str(part) for part in (PIPELINE_VERSION, *model, *summary_settings().values()))
 
 
 @app.route('/')
@@ -98,17 +395,14 @@ def submit():
         subject = request.form['subject']
         message = request.form['message']
 
-        # Veritabanı bağlantısını al ve verileri ekle
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO form_responses (name, email, subject, message) VALUES (?, ?, ?, ?)',
-                       (name, email, subject, message))
-        conn.commit()
-        conn.close()
+        # Verileri veritabanına ekle
+        database.save_form_response(name, email, subject, message, DATABASE)
 
         thank_you_message = f"Thank you {name}, your message has been sent."
         return jsonify(message=thank_you_message)
 
 
 if __name__ == '__main__':
+    start_server()
+    start_worker()
     app.run(debug=True)
@@ -0,0 +1,176 @@
+"""
+Compares the summarization backends of summ.py (torch, int8, onnx) on CPU.
+
+Each backend runs in its own subprocess with SARA_BACKEND set, so peak RSS is measured per
+backend. The inputs are texts from a data/ spreadsheet, and the same texts serve as the
+reference summaries for ROUGE. Each backend is also scored against the full-precision torch
+output, which shows how much quantization or export changes the summaries themselves.
+
+Run from the repository root:
+
+    python -m benchmarks.compare_backends --backends torch int8 onnx --samples 32
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from summarization import iter_texts
+
+
+def _tokens(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def _f1(overlap, candidate_total, reference_total):
+    if not overlap:
+        return 0.0
+    precision = overlap / candidate_total
+    recall = overlap / reference_total
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_n(candidate, reference, n):
+    candidate_ngrams = Counter(zip(*(candidate[i:] for i in range(n))))
+    reference_ngrams = Counter(zip(*(reference[i:] for i in range(n))))
+    overlap = sum((candidate_ngrams & reference_ngrams).values())
+    return _f1(overlap, sum(candidate_ngrams.values()), sum(reference_ngrams.values()))
+
+
+def rouge_l(candidate, reference):
+    previous = [0] * (len(reference) + 1)
+    for token in candidate:
+        current = [0]
+        for j, reference_token in enumerate(reference):
+            current.append(previous[j] + 1 if token == reference_token else max(previous[j + 1], current[j]))
+        previous = current
+    return _f1(previous[-1], len(candidate), len(reference))
+
+
+def rouge(candidates, references):
+    """
+    Returns the mean ROUGE-1, ROUGE-2 and ROUGE-L F1 of candidates against references.
+    """
+    scores = {'rouge1': 0.0, 'rouge2': 0.0, 'rougeL': 0.0}
+    for candidate, reference in zip(candidates, references):
+        candidate, reference = _tokens(candidate), _tokens(reference)
+        scores['rouge1'] += rouge_n(candidate, reference, 1)
+        scores['rouge2'] += rouge_n(candidate, reference, 2)
+        scores['rougeL'] += rouge_l(candidate, reference)
+    return {name: total / max(len(references), 1) for name, total in scores.items()}
+
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(percentile / 100 * (len(ordered) - 1)))]
+
+
+def decoding_settings(model):
+    """
+    Describes how the model decodes: greedy for the onnx backend, the search settings of its
+    generation config otherwise.
+    """
+    config = getattr(model, 'generation_config', None)
+    if config is None:
+        return 'greedy max_length={}'.format(model.max_length)
+    settings = ['beams={}'.format(config.num_beams), 'max_length={}'.format(config.max_length)]
+    if config.num_beams > 1:
+        settings.append('length_penalty={}'.format(config.length_penalty))
+    if config.no_repeat_ngram_size:
+        settings.append('no_repeat_ngram={}'.format(config.no_repeat_ngram_size))
+    return ' '.join(settings)
+
+
+def run_backend(texts, batch_size):
+    """
+    Runs inside the backend subprocess: loads summ with the backend from SARA_BACKEND and
+    measures load time, per-request latency, batched throughput and peak RSS.
+    """
+    import summ
+
+    started = time.perf_counter()
+    summ.get_tokenizer()
+    model = summ.get_model()  # summ loads nothing at import
+    load_seconds = time.perf_counter() - started
+
+    summ.generate_summary(texts[0])  # Warm-up
+    latencies = []
+    summaries = []
+    for text in texts:
+        started = time.perf_counter()
+        summaries.append(summ.generate_summary(text))
+        latencies.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    summ.generate_summaries(texts, batch_size=batch_size)
+    batched_seconds = time.perf_counter() - started
+    return {
+        'backend': summ.backend,
+        'decoding': decoding_settings(model),
+        'load_seconds': load_seconds,
+        'latency_p50': _percentile(latencies, 50),
+        'latency_p95': _percentile(latencies, 95),
+        'batched_texts_per_second': len(texts) / batched_seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'summaries': summaries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=['torch', 'int8', 'onnx'])
+    parser.add_argument("--corpus", default="data/tr_summaries.xlsx")
+    parser.add_argument("--samples", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--run-backend", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_backend:
+        with open(args.run_backend, encoding='utf-8') as file:
+            texts = json.load(file)
+        json.dump(run_backend(texts, args.batch_size), sys.stdout)
+        return
+
+    texts = []
+    for _, _, text in iter_texts(args.corpus):
+        texts.append(text)
+        if len(texts) == args.samples:
+            break
+    with tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8', delete=False) as file:
+        json.dump(texts, file)
+    results = {}
+    try:
+        for backend in args.backends:
+            completed = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.compare_backends', '--run-backend', file.name,
+                 '--batch-size', str(args.batch_size)],
+                env={**os.environ, 'SARA_BACKEND': backend}, capture_output=True, text=True, check=True)
+            results[backend] = json.loads(completed.stdout)
+    finally:
+        os.remove(file.name)
+
+    baseline = results.get('torch')
+    print(f"{'backend':>8} {'load s':>7} {'p50 s':>7} {'p95 s':>7} {'batch/s':>8} {'RSS MB':>8} "
+          f"{'R1 vs torch':>11} {'R2 vs torch':>11} {'RL vs torch':>11}  decoding")
+    for backend, result in results.items():
+        if baseline is not None:
+            result['rouge_vs_torch'] = rouge(result['summaries'], baseline['summaries'])
+        agreement = [f"{result['rouge_vs_torch'][name]:.3f}" if baseline is not None else '-'
+                     for name in ('rouge1', 'rouge2', 'rougeL')]
+        print(f"{backend:>8} {result['load_seconds']:>7.2f} {result['latency_p50']:>7.3f} "
+              f"{result['latency_p95']:>7.3f} {result['batched_texts_per_second']:>8.2f} "
+              f"{result['peak_rss_mb']:>8.0f} {agreement[0]:>11} {agreement[1]:>11} {agreement[2]:>11}  "
+              f"{result['decoding']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
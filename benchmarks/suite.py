@@ -0,0 +1,252 @@
+"""
+Benchmarks every stage of the summarization pipeline, offline and on CPU.
+
+Synthetic corpora of increasing size are built from the data/*.xlsx texts, and each stage is
+timed on its own:
+
+- extractive: Summarizer.summarize
+- generate.single, generate.batched: summ.generate_summary and summ.generate_summaries
+  with a tiny local model built by benchmarks/tiny_model.py
+- pdf.extract: ingest.extract_text on generated PDFs
+- sqlite.save_article, sqlite.get_article_summary and sqlite.get_recent_articles (RECENT_CALLS
+  calls per run) on a scratch database
+
+The report is JSON with latency percentiles per stage and size, the peak Python heap of one
+extra run, and the peak RSS of the process. Passing --baseline compares the p50 of every stage
+with a stored report and exits with status 1 when a stage got slower than the tolerance.
+
+    python -m benchmarks.suite --output bench.json --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+
+benchmarks/baseline.json is the stored report. Stages missing from a baseline are reported but
+not compared; regenerate it on the machine that runs the comparison.
+
+The NLTK data must be installed locally (python nlp_resources.py --download).
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+
+from summarization import iter_texts  # noqa: E402
+
+
+CORPORA = ('data/tr_summaries.xlsx', 'data/en_summaries.xlsx')
+DEFAULT_SIZES = (10, 50, 200)
+DEFAULT_GENERATE_SIZES = (4, 16)
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_SECONDS = 0.002  # Ignore slowdowns below timer noise
+RECENT_CALLS = 100
+
+
+def _percentile(ordered, percentile):
+    return ordered[min(len(ordered) - 1, round(percentile / 100 * (len(ordered) - 1)))]
+
+
+def measure(func, repeat=DEFAULT_REPEAT, warmup=1, setup=None):
+    """
+    Times func repeat times after warmup calls, then runs it once more under tracemalloc to
+    record the peak Python heap. When setup is given it runs, untimed, before every call and
+    its result is passed to func.
+    """
+    def call():
+        if setup is None:
+            started = time.perf_counter()
+            func()
+        else:
+            state = setup()
+            started = time.perf_counter()
+            func(state)
+        return time.perf_counter() - started
+
+    for _ in range(warmup):
+        call()
+    timings = [call() for _ in range(repeat)]
+    state = setup() if setup is not None else None
+    tracemalloc.start()
+    try:
+        func() if setup is None else func(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    ordered = sorted(timings)
+    return {
+        'runs': repeat,
+        'mean': statistics.fmean(ordered),
+        'min': ordered[0],
+        'p50': _percentile(ordered, 50),
+        'p90': _percentile(ordered, 90),
+        'p99': _percentile(ordered, 99),
+        'peak_python_bytes': peak,
+    }
+
+
+def load_corpus():
+    texts = []
+    for path in CORPORA:
+        texts.extend(text for _, _, text in iter_texts(path))
+    return texts
+
+
+def build_document(texts, size):
+    return "\n\n".join(itertools.islice(itertools.cycle(texts), size))
+
+
+def bench_extractive(texts, sizes, repeat):
+    from summarize import Summarizer
+
+    summarizer = Summarizer("turkish-english-summarizer")
+    results = {}
+    for size in sizes:
+        document = build_document(texts, size)
+        results[f'extractive[texts={size}]'] = measure(lambda: summarizer.summarize(document), repeat)
+    return results
+
+
+def bench_generate(texts, sizes, repeat, model_dir):
+    os.environ['SARA_CHECKPOINT'] = model_dir
+    os.environ['SARA_BACKEND'] = 'torch'
+    import summ
+
+    summ.warm_up()
+    results = {}
+    for size in sizes:
+        inputs = list(itertools.islice(itertools.cycle(texts), size))
+        results[f'generate.single[texts={size}]'] = measure(
+            lambda: [summ.generate_summary(text) for text in inputs], repeat)
+        results[f'generate.batched[texts={size}]'] = measure(lambda: summ.generate_summaries(inputs), repeat)
+    return results
+
+
+def bench_pdf(texts, sizes, repeat):
+    import fitz
+    from ingest import extract_text
+
+    results = {}
+    pages = itertools.cycle(texts)
+    for size in sizes:
+        document = fitz.open()
+        for _ in range(size):
+            document.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), next(pages), fontsize=9)
+        data = document.tobytes()
+        document.close()
+        results[f'pdf.extract[pages={size}]'] = measure(lambda: extract_text(data, 'pdf'), repeat)
+    return results
+
+
+def bench_sqlite(texts, sizes, repeat, db_dir):
+    import database
+
+    results = {}
+    databases = itertools.count()
+    for size in sizes:
+        filenames = [f'article-{i}.pdf' for i in range(size)]
+        summaries = list(itertools.islice(itertools.cycle(texts), size))
+
+        def empty_database():
+            path = os.path.join(db_dir, f'bench-{next(databases)}.sqlite3')
+            database.get_connection(path)  # Creates the schema outside the timing
+            return path
+
+        def save(path):
+            for filename, summary in zip(filenames, summaries):
+                database.save_article(filename, summary, path)
+
+        # Every save starts from an empty database, so each call inserts into the same table
+        results[f'sqlite.save_article[rows={size}]'] = measure(save, repeat, setup=empty_database)
+        path = empty_database()
+        save(path)  # Lookups run against exactly size rows
+        results[f'sqlite.get_article_summary[rows={size}]'] = measure(
+            lambda: [database.get_article_summary(filename, path) for filename in filenames], repeat)
+        results[f'sqlite.get_recent_articles[rows={size}]'] = measure(
+            lambda: [database.get_recent_articles(path=path) for _ in range(RECENT_CALLS)], repeat)
+    database.close_connections()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a message for every stage whose p50 exceeds the baseline p50 by more than the
+    tolerance.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        limit = previous['p50'] * (1 + tolerance)
+        if current['p50'] > limit and current['p50'] - previous['p50'] > MIN_REGRESSION_SECONDS:
+            regressions.append(f"{name}: p50 {current['p50']:.4f}s vs baseline {previous['p50']:.4f}s "
+                               f"(+{(current['p50'] / previous['p50'] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stages", nargs="+", default=['extractive', 'generate', 'pdf', 'sqlite'])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--generate-sizes", type=int, nargs="+", default=list(DEFAULT_GENERATE_SIZES))
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Fail when a stage is slower than this stored report")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", help="Also store the report as a baseline at this path")
+    args = parser.parse_args()
+
+    texts = load_corpus()
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        if 'extractive' in args.stages:
+            results.update(bench_extractive(texts, args.sizes, args.repeat))
+        if 'generate' in args.stages:
+            from benchmarks.tiny_model import build
+
+            model_dir = build(texts, os.path.join(scratch, 'tiny-bert2bert'))
+            results.update(bench_generate(texts, args.generate_sizes, args.repeat, model_dir))
+        if 'pdf' in args.stages:
+            results.update(bench_pdf(texts, args.sizes, args.repeat))
+        if 'sqlite' in args.stages:
+            results.update(bench_sqlite(texts, args.sizes, args.repeat, scratch))
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as output:
+            output.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print("PERFORMANCE REGRESSION", *regressions, sep="\n  ", file=sys.stderr)
+            sys.exit(1)
+        print(f"No stage regressed by more than {args.tolerance:.0%} against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
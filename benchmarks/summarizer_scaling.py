@@ -0,0 +1,93 @@
+"""
+Compares how the extractive scoring of Summarizer scales with document size against the
+previous implementation, which checked every vocabulary word against every sentence.
+
+Run from the repository root:
+
+    python -m benchmarks.summarizer_scaling --sizes 50 200 800 3200
+"""
+import argparse
+import string
+import time
+
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize, sent_tokenize
+
+from summarization import get_text_summary
+from summarize import Summarizer
+
+
+def legacy_summarize(text, stop_words):
+    """
+    Reference copy of the sentences x vocabulary scoring that Summarizer used before the
+    word to sentence index, kept here only as the baseline for this benchmark.
+    """
+    def create_sentence_freq_dict():
+        clean_text = text.translate(str.maketrans('', '', string.punctuation)).lower()
+        word_freq_dict = {}
+        for word in word_tokenize(clean_text):
+            if word not in stop_words:
+                word_freq_dict[word] = word_freq_dict.get(word, 0) + 1
+        sentence_freq_dict = {}
+        for sentence in sent_tokenize(text):
+            sentence = sentence.lower()
+            sentence_freq = 0
+            for word, freq in word_freq_dict.items():
+                if word in sentence:
+                    sentence_freq += freq
+            sentence_freq_dict[sentence] = sentence_freq
+        return sentence_freq_dict
+
+    summary = ""
+    sentences = sent_tokenize(text)
+    sentence_freq_dict = create_sentence_freq_dict()
+    average = sum(create_sentence_freq_dict().values()) / len(sentence_freq_dict)
+    for sentence in sentences:
+        if sentence_freq_dict.get(sentence.lower(), 0) > 1.2 * average:
+            summary += " " + sentence
+    return summary
+
+
+def build_document(sentences, size):
+    """
+    Builds a document of `size` sentences by cycling through the corpus sentences.
+    """
+    return " ".join(sentences[i % len(sentences)] for i in range(size))
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default="data/tr_summaries.xlsx")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 800, 3200])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy-above", type=int, default=3200,
+                        help="Do not time the legacy implementation above this many sentences.")
+    args = parser.parse_args()
+
+    corpus = " ".join(str(text) for text in get_text_summary(args.corpus) if text)
+    sentences = sent_tokenize(corpus)
+    summarizer = Summarizer("turkish-english-summarizer")
+    stop_words = set(stopwords.words('turkish'))
+
+    print(f"{'sentences':>10} {'chars':>10} {'indexed (s)':>12} {'legacy (s)':>12} {'speedup':>8}")
+    for size in args.sizes:
+        document = build_document(sentences, size)
+        indexed = best_of(lambda: summarizer.summarize(document), args.repeat)
+        if size > args.skip_legacy_above:
+            print(f"{size:>10} {len(document):>10} {indexed:>12.4f} {'-':>12} {'-':>8}")
+            continue
+        legacy = best_of(lambda: legacy_summarize(document, stop_words), args.repeat)
+        print(f"{size:>10} {len(document):>10} {indexed:>12.4f} {legacy:>12.4f} {legacy / indexed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
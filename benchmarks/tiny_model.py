@@ -0,0 +1,50 @@
+"""
+Builds a tiny, randomly initialized bert2bert checkpoint for offline benchmarks.
+
+The vocabulary is taken from the benchmark corpus so tokenization behaves like real text,
+and the encoder and decoder are two-layer BERTs with a small hidden size. Point summ.py at
+the result with SARA_CHECKPOINT; nothing is downloaded.
+"""
+import os
+import re
+from collections import Counter
+
+SPECIAL_TOKENS = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]']
+VOCAB_SIZE = 4000
+HIDDEN_SIZE = 64
+SUMMARY_MAX_LENGTH = 32
+
+
+def build(texts, output_dir, seed=0):
+    """
+    Writes a tokenizer and an EncoderDecoderModel to output_dir and returns output_dir.
+    """
+    import torch
+    from transformers import BertConfig, BertTokenizerFast, EncoderDecoderConfig, EncoderDecoderModel
+
+    os.makedirs(output_dir, exist_ok=True)
+    counts = Counter(word for text in texts for word in re.findall(r'\w+|[^\w\s]', text.lower()))
+    characters = sorted({character for word in counts for character in word})
+    words = [word for word, _ in counts.most_common(VOCAB_SIZE) if word not in characters]
+    vocab = SPECIAL_TOKENS + characters + ['##' + character for character in characters] + words
+    vocab_file = os.path.join(output_dir, 'vocab.txt')
+    with open(vocab_file, 'w', encoding='utf-8') as file:
+        file.write("\n".join(vocab) + "\n")
+    tokenizer = BertTokenizerFast(vocab_file, do_lower_case=True)
+
+    torch.manual_seed(seed)
+    layers = dict(vocab_size=len(vocab), hidden_size=HIDDEN_SIZE, num_hidden_layers=2, num_attention_heads=2,
+                  intermediate_size=HIDDEN_SIZE * 2, max_position_embeddings=512)
+    config = EncoderDecoderConfig.from_encoder_decoder_configs(
+        BertConfig(**layers), BertConfig(**layers, is_decoder=True, add_cross_attention=True))
+    config.decoder_start_token_id = tokenizer.cls_token_id
+    config.eos_token_id = tokenizer.sep_token_id
+    config.pad_token_id = tokenizer.pad_token_id
+    model = EncoderDecoderModel(config=config)
+    model.generation_config.decoder_start_token_id = tokenizer.cls_token_id
+    model.generation_config.eos_token_id = tokenizer.sep_token_id
+    model.generation_config.pad_token_id = tokenizer.pad_token_id
+    model.generation_config.max_length = SUMMARY_MAX_LENGTH
+    model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    return output_dir
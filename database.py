@@ -0,0 +1,266 @@
+"""
+Data access for the application SQLite database.
+
+Connections are pooled per process, per thread and per database file. Every connection is opened in WAL
+mode with tuned pragmas so readers are not blocked by a writer. The schema is versioned
+through PRAGMA user_version, and pending migrations run once per process, in a single
+transaction, before the first connection to a database is handed out.
+"""
+import os
+import sqlite3 as sql
+import threading
+import unicodedata
+
+
+DEFAULT_DATABASE = 'db/db.sqlite3'
+RECENT_ARTICLES_LIMIT = 5
+SNIPPET_START = '\x02'  # Brackets the matched terms in search snippets; callers pick the markup
+SNIPPET_END = '\x03'
+SNIPPET_TOKENS = 24
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',  # Durable across application crashes, fsyncs only at checkpoints
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA cache_size = -16000',  # 16 MiB page cache per connection
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 268435456',
+)
+
+# Each entry upgrades the schema from the previous version to its own version.
+MIGRATIONS = (
+    (1, (
+        'CREATE TABLE IF NOT EXISTS "articles" ('
+        '"id" INTEGER, "filename" TEXT NOT NULL, "summary" TEXT NOT NULL, '
+        'PRIMARY KEY("id" AUTOINCREMENT))',
+        'CREATE TABLE IF NOT EXISTS "form_responses" ('
+        '"id" INTEGER, "name" TEXT NOT NULL, "email" TEXT NOT NULL, "subject" TEXT NOT NULL, '
+        '"message" TEXT NOT NULL, PRIMARY KEY("id" AUTOINCREMENT))',
+        # Serves the filename lookup and picks its newest row without a sort. The recency
+        # ordering of the article list is served by the rowid primary key.
+        'CREATE INDEX IF NOT EXISTS idx_articles_filename_id ON articles (filename, id DESC)',
+    )),
+    (2, (
+        'CREATE TABLE IF NOT EXISTS summary_cache ('
+        'key TEXT PRIMARY KEY, summary TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        'id TEXT PRIMARY KEY, filename TEXT NOT NULL, status TEXT NOT NULL, '
+        'attempts INTEGER NOT NULL DEFAULT 0, summary TEXT, error TEXT, '
+        'created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)',
+    )),
+    (3, (
+        # JSON list of [stage, seconds] pairs, reported in the Server-Timing header of /jobs
+        'ALTER TABLE jobs ADD COLUMN timings TEXT',
+    )),
+    (4, (
+        # External content index over articles: the text is stored once, in articles, and the
+        # triggers below keep the index in step with every insert, update and delete.
+        "CREATE VIRTUAL TABLE articles_fts USING fts5(filename, summary, content='articles', "
+        "content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        'CREATE TRIGGER articles_fts_insert AFTER INSERT ON articles BEGIN '
+        'INSERT INTO articles_fts (rowid, filename, summary) VALUES (new.id, new.filename, new.summary); END',
+        'CREATE TRIGGER articles_fts_delete AFTER DELETE ON articles BEGIN '
+        "INSERT INTO articles_fts (articles_fts, rowid, filename, summary) "
+        "VALUES ('delete', old.id, old.filename, old.summary); END",
+        'CREATE TRIGGER articles_fts_update AFTER UPDATE ON articles BEGIN '
+        "INSERT INTO articles_fts (articles_fts, rowid, filename, summary) "
+        "VALUES ('delete', old.id, old.filename, old.summary); "
+        'INSERT INTO articles_fts (rowid, filename, summary) VALUES (new.id, new.filename, new.summary); END',
+        "INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')",  # Index the existing articles
+    )),
+    (5, (
+        # The server whose worker pool holds the upload of the job, see jobs.claim_ownership
+        'ALTER TABLE jobs ADD COLUMN owner TEXT',
+    )),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_local = threading.local()
+_inherited = []  # Pools of a parent process, kept open but never used after fork
+_migrated = set()
+_migration_lock = threading.Lock()
+
+
+def migrate(conn: sql.Connection) -> int:
+    """
+    Applies the migrations newer than the schema version stored in the database, together
+    with the version bump, in one transaction. The transaction takes the write lock before it
+    reads the version, so processes migrating the same database at once apply every
+    migration exactly once, and a migration that fails part-way leaves no trace.
+
+    :param conn: An open connection to the database.
+    :type conn: sqlite3.Connection
+    :return: The schema version after migrating.
+    :rtype: int
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # DDL would otherwise commit the implicit transaction
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for target, statements in MIGRATIONS:
+                if target <= version:
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {target}')
+                version = target
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.isolation_level = isolation_level
+    return version
+
+
+def _connections() -> dict[str, sql.Connection]:
+    pid, connections = getattr(_local, 'pool', (None, None))
+    if pid != os.getpid():
+        if connections:
+            # SQLite connections must not be used across fork, and closing them here could
+            # release locks the parent still relies on
+            _inherited.append(connections)
+        connections = {}
+        _local.pool = (os.getpid(), connections)
+    return connections
+
+
+def get_connection(path: str = DEFAULT_DATABASE) -> sql.Connection:
+    """
+    Returns the connection of the calling thread to the given database, opening and
+    configuring it on first use. Callers must not close it. A process forked from another
+    opens its own connections rather than reusing those of its parent.
+
+    :param path: Path of the SQLite database file.
+    :type path: str
+    :return: A connection whose rows are sqlite3.Row objects.
+    :rtype: sqlite3.Connection
+    """
+    connections = _connections()
+    conn = connections.get(path)
+    if conn is None:
+        conn = sql.connect(path)
+        conn.row_factory = sql.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if path not in _migrated:
+            with _migration_lock:
+                if path not in _migrated:
+                    migrate(conn)
+                    _migrated.add(path)
+        connections[path] = conn
+    return conn
+
+
+def close_connections() -> None:
+    """
+    Closes every pooled connection of the calling thread.
+    """
+    connections = _connections()
+    while connections:
+        connections.popitem()[1].close()
+
+
+def save_article(filename: str, summary: str, path: str = DEFAULT_DATABASE) -> None:
+    conn = get_connection(path)
+    with conn:
+        conn.execute('INSERT INTO articles (filename, summary) VALUES (?, ?)', (filename, summary))
+
+
+def get_article_summary(filename: str, path: str = DEFAULT_DATABASE) -> str | None:
+    """
+    :return: The summary most recently stored under the filename, or None if there is none.
+    :rtype: str | None
+    """
+    row = get_connection(path).execute(
+        'SELECT summary FROM articles WHERE filename = ? ORDER BY id DESC LIMIT 1', (filename,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def get_recent_articles(limit: int = RECENT_ARTICLES_LIMIT, path: str = DEFAULT_DATABASE,
+                        before_id: int | None = None) -> list[sql.Row]:
+    """
+    Returns the newest articles as (filename, summary, id) rows, newest first. Pages are
+    fetched by keyset: pass the id of the last row of a page as before_id to get the next
+    one, which is a range scan of the rowid however deep the page is.
+
+    :param limit: The maximum number of articles.
+    :type limit: int
+    :param path: Path of the SQLite database file.
+    :type path: str
+    :param before_id: Only return articles older than the article with this id.
+    :type before_id: int | None
+    :return: The article rows.
+    :rtype: list[sqlite3.Row]
+    """
+    if before_id is None:
+        return get_connection(path).execute(
+            'SELECT filename, summary, id FROM articles ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    return get_connection(path).execute(
+        'SELECT filename, summary, id FROM articles WHERE id < ? ORDER BY id DESC LIMIT ?',
+        (before_id, limit)).fetchall()
+
+
+def match_expression(query: str) -> str:
+    """
+    Turns free text into an FTS5 query that matches articles containing every word of it. Each
+    word is quoted, so user input cannot form FTS5 syntax; a trailing '*' on a word keeps its
+    prefix search. Control and other non-printing characters, which SQLite rejects in a
+    query, are dropped.
+
+    :param query: The text typed by the user.
+    :type query: str
+    :return: The MATCH expression, or '' when the text has no words.
+    :rtype: str
+    """
+    query = ''.join(char for char in query if unicodedata.category(char)[0] != 'C')
+    terms = []
+    for word in query.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"{}"{}'.format(word.replace('"', '""'), '*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def search_articles(query: str, limit: int = RECENT_ARTICLES_LIMIT, offset: int = 0,
+                    path: str = DEFAULT_DATABASE) -> list[sql.Row]:
+    """
+    Full-text searches the filenames and summaries of the articles, best match first.
+
+    Rows have the columns id, filename, snippet and score. The snippet is an excerpt of the
+    summary with the matched terms between SNIPPET_START and SNIPPET_END, and the score is the
+    bm25 rank, where lower is better; filename matches weigh twice as much as summary matches.
+    Ranking needs every match, so pages are fetched by offset.
+
+    :param query: The text typed by the user, see match_expression.
+    :type query: str
+    :param limit: The maximum number of results.
+    :type limit: int
+    :param offset: The number of best results to skip.
+    :type offset: int
+    :param path: Path of the SQLite database file.
+    :type path: str
+    :return: The matching rows.
+    :rtype: list[sqlite3.Row]
+    """
+    expression = match_expression(query)
+    if not expression:
+        return []
+    return get_connection(path).execute(
+        'SELECT rowid AS id, filename, snippet(articles_fts, 1, ?, ?, \'…\', ?) AS snippet, '
+        'bm25(articles_fts, 2.0, 1.0) AS score FROM articles_fts WHERE articles_fts MATCH ? '
+        'ORDER BY score LIMIT ? OFFSET ?',
+        (SNIPPET_START, SNIPPET_END, SNIPPET_TOKENS, expression, limit, offset)).fetchall()
+
+
+def save_form_response(name: str, email: str, subject: str, message: str, path: str = DEFAULT_DATABASE) -> None:
+    conn = get_connection(path)
+    with conn:
+        conn.execute('INSERT INTO form_responses (name, email, subject, message) VALUES (?, ?, ?, ?)',
+                     (name, email, subject, message))
@@ -0,0 +1,24 @@
+# Import the app, and with SARA_PRELOAD=1 load the model, in the master process before forking.
+# Workers then share the model weights copy-on-write. Every worker starts its job pool and then
+# warms up on its own thread once it is forked.
+import os
+
+bind = os.environ.get('SARA_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('SARA_WEB_WORKERS', 2))
+# Threaded workers, so that uploads waiting for admission do not block /jobs polling and /ready
+threads = int(os.environ.get('SARA_WEB_THREADS', 8))
+# Every web worker starts its own pool of SARA_JOB_WORKERS job processes
+wsgi_app = 'app:app'
+preload_app = True
+
+
+def when_ready(server):
+    import app
+
+    app.start_server()
+
+
+def post_fork(server, worker):
+    import app
+
+    app.start_worker()
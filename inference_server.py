@@ -0,0 +1,322 @@
+"""
+Local inference server that owns the summarization model.
+
+One process loads the model and serves generate requests over a Unix socket. Requests that
+arrive within a short window are merged into one batch and run through
+summ.generate_summaries_in_process, which pads each batch only to its longest input. Web and
+job workers talk to it through InferenceClient instead of loading their own copy of the model.
+
+    SARA_INFERENCE_AUTHKEY=<secret> python inference_server.py --max-batch-size 16 --max-wait-ms 10
+
+Start the app with SARA_INFERENCE_SOCKET set to the socket path and the same
+SARA_INFERENCE_AUTHKEY. Messages are pickled, so the secret has no default and the socket
+lives in a directory only its user can enter, by default DEFAULT_SOCKET. summ.generate_summaries
+sends its texts to the server and generates in process only when the server cannot be reached;
+a server that is overloaded or does not answer in time fails the request instead, so workers
+do not all load the model exactly when the system is busiest.
+"""
+import argparse
+import os
+import queue
+import stat
+import tempfile
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+import summ
+from metrics import record_size
+
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'sara-{}'.format(os.getuid()), 'inference.sock')
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_WAIT = 0.01  # Seconds a batch waits for more requests
+DEFAULT_MAX_QUEUE_TIME = 30.0  # Seconds a request may wait before it is failed back to the client
+DEFAULT_MAX_QUEUE = 256  # Requests waiting for a batch
+DEFAULT_CLIENT_TIMEOUT = 120.0
+
+
+class InferenceUnavailable(Exception):
+    """
+    The inference server cannot be reached; the caller should generate the summaries itself.
+    """
+
+
+class InferenceError(Exception):
+    """
+    The inference server refused the request, failed it or did not answer in time.
+    """
+
+
+def check_private_directory(path: str, create: bool = False) -> None:
+    """
+    Checks that the directory of a socket path belongs to this user and is closed to everyone
+    else, so no other user can replace the socket or connect to it.
+
+    :param path: Path of the Unix socket.
+    :type path: str
+    :param create: Create the directory, with mode 700, if it does not exist.
+    :type create: bool
+    :raises FileNotFoundError: If the directory does not exist.
+    :raises PermissionError: If the directory is not private to this user.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if create:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError('{} must be a directory owned by this user with mode 700'.format(directory))
+
+
+class _Request:
+    __slots__ = ('texts', 'max_length', 'enqueued', 'done', 'summaries', 'tokens', 'error')
+
+    def __init__(self, texts, max_length):
+        self.texts = texts
+        self.max_length = max_length
+        self.enqueued = time.monotonic()
+        self.done = threading.Event()
+        self.summaries = None
+        self.tokens = 0
+        self.error = None
+
+    def finish(self, summaries=None, tokens=0, error=None):
+        self.summaries = summaries
+        self.tokens = tokens
+        self.error = error
+        self.done.set()
+
+
+class InferenceServer:
+    def __init__(self, address: str, authkey: bytes, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_MAX_WAIT, max_queue_time: float = DEFAULT_MAX_QUEUE_TIME,
+                 max_queue: int = DEFAULT_MAX_QUEUE):
+        """
+        Creates a server for the model of this process.
+
+        :param address: Path of the Unix socket to listen on, in a private directory.
+        :type address: str
+        :param authkey: Shared secret clients must present.
+        :type authkey: bytes
+        :param max_batch_size: A batch is closed once it holds this many texts.
+        :type max_batch_size: int
+        :param max_wait: Seconds a batch stays open for more requests once the queued ones
+                         are collected.
+        :type max_wait: float
+        :param max_queue_time: Requests that waited longer than this many seconds for a batch
+                               are failed, so their clients fail fast instead of piling up.
+        :type max_queue_time: float
+        :param max_queue: Requests that may wait for a batch; further requests are refused.
+        :type max_queue: int
+        """
+        self.address = address
+        self.authkey = authkey
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue_time = max_queue_time
+        self.__queue = queue.Queue(maxsize=max_queue)
+        self.__listener = None
+
+    def __collect_batch(self) -> list[_Request]:
+        """
+        Takes the requests that queued up while the previous batch ran, then waits up to
+        max_wait for more, until the batch holds max_batch_size texts.
+        """
+        first = self.__queue.get()
+        batch = [first]
+        size = len(first.texts)
+        while size < self.max_batch_size:
+            try:
+                request = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.__queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def __run_batches(self):
+        while True:
+            batch = self.__collect_batch()
+            now = time.monotonic()
+            groups = {}
+            for request in batch:
+                if now - request.enqueued > self.max_queue_time:
+                    request.finish(error='queue time limit exceeded')
+                else:
+                    groups.setdefault(request.max_length, []).append(request)
+            for max_length, requests in groups.items():
+                texts = [text for request in requests for text in request.texts]
+                try:
+                    summaries = summ.generate_summaries_in_process(texts, batch_size=self.max_batch_size,
+                                                                   max_length=max_length)
+                    # Encoder tokens of every text: its tokens plus [CLS] and [SEP], truncated
+                    lengths = [min(length + 2, max_length) for length in summ.count_tokens(texts)]
+                except Exception as e:
+                    for request in requests:
+                        request.finish(error=repr(e))
+                    continue
+                start = 0
+                for request in requests:
+                    stop = start + len(request.texts)
+                    request.finish(summaries[start:stop], sum(lengths[start:stop]))
+                    start = stop
+
+    def __serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                request = _Request(list(message['texts']), message.get('max_length', summ.MAX_INPUT_LENGTH))
+                try:
+                    self.__queue.put_nowait(request)
+                except queue.Full:
+                    request.finish(error='inference queue is full')
+                request.done.wait()
+                if request.error is not None:
+                    response = {'error': request.error}
+                else:
+                    response = {'summaries': request.summaries, 'tokens': request.tokens}
+                try:
+                    conn.send(response)
+                except OSError:
+                    return  # The client gave up on this request
+
+    def serve_forever(self) -> None:
+        """
+        Listens on the socket and answers requests until the process is stopped.
+        """
+        check_private_directory(self.address, create=True)
+        try:
+            info = os.lstat(self.address)
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(info.st_mode):
+                raise FileExistsError('{} exists and is not a socket'.format(self.address))
+            os.unlink(self.address)  # Left behind by a server that did not shut down cleanly
+        self.__listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        threading.Thread(target=self.__run_batches, name='inference-batches', daemon=True).start()
+        print("Serving the summarization model on {}".format(self.address))
+        try:
+            while True:
+                try:
+                    conn = self.__listener.accept()
+                except (AuthenticationError, OSError) as e:
+                    print('Refused an inference connection: {}'.format(e))
+                    continue
+                threading.Thread(target=self.__serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.__listener.close()
+
+
+class InferenceClient:
+    def __init__(self, address: str, authkey: bytes, timeout: float = DEFAULT_CLIENT_TIMEOUT):
+        """
+        Sends generate requests to an InferenceServer. Every thread keeps its own connection,
+        opened on first use.
+
+        :param address: Path of the server's Unix socket.
+        :type address: str
+        :param authkey: The server's shared secret.
+        :type authkey: bytes
+        :param timeout: Seconds to wait for the summaries of one request.
+        :type timeout: float
+        """
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.__local = threading.local()
+
+    def __connect(self):
+        try:
+            check_private_directory(self.address)
+            conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+        except (AuthenticationError, PermissionError) as e:
+            raise InferenceError(repr(e)) from e  # Misconfigured; generating here would hide it
+        except OSError as e:
+            raise InferenceUnavailable(repr(e)) from e
+        self.__local.connection = (os.getpid(), conn)
+        return conn
+
+    def __connection(self):
+        """
+        :return: The connection of this thread, and whether it was opened just now.
+        :rtype: tuple[multiprocessing.connection.Connection, bool]
+        """
+        pid, conn = getattr(self.__local, 'connection', (None, None))
+        if pid != os.getpid():  # Never share a connection inherited from a parent process
+            return self.__connect(), True
+        return conn, False
+
+    def __discard(self):
+        _, conn = getattr(self.__local, 'connection', (None, None))
+        self.__local.connection = (None, None)
+        if conn is not None:
+            conn.close()
+
+    def generate_summaries(self, texts, max_length: int = summ.MAX_INPUT_LENGTH) -> list[str]:
+        """
+        :return: The summary of every text, in input order.
+        :rtype: list[str]
+        :raises InferenceUnavailable: If the server cannot be reached.
+        :raises InferenceError: If the server refuses or fails the request, does not answer
+                                within the timeout, or does not accept the shared secret.
+        """
+        message = {'texts': list(texts), 'max_length': max_length}
+        while True:
+            conn, fresh = self.__connection()
+            try:
+                conn.send(message)
+                if not conn.poll(self.timeout):
+                    self.__discard()  # The late answer must not be read as the next one
+                    raise InferenceError('no answer within {}s'.format(self.timeout))
+                response = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                self.__discard()
+                if fresh:
+                    raise InferenceUnavailable(repr(e)) from e
+                # The server went away since the last request, e.g. it restarted; retry once on a new connection
+        if 'error' in response:
+            raise InferenceError(response['error'])
+        record_size('tokens', response['tokens'])
+        return response['summaries']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the summarization model to local workers.")
+    parser.add_argument("--socket", default=os.environ.get('SARA_INFERENCE_SOCKET', DEFAULT_SOCKET))
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT * 1000,
+                        help="How long a batch waits for more requests once the queued ones are collected")
+    parser.add_argument("--max-queue-time", type=float, default=DEFAULT_MAX_QUEUE_TIME,
+                        help="Seconds a request may wait before it is failed back to its client")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    args = parser.parse_args()
+
+    authkey = os.environ.get('SARA_INFERENCE_AUTHKEY')
+    if not authkey:
+        parser.error('set SARA_INFERENCE_AUTHKEY to a secret shared with the app')
+
+    summ.inference_socket = None  # This process is the server; generate in process
+    summ.warm_up()
+    InferenceServer(args.socket, authkey.encode(), max_batch_size=args.max_batch_size,
+                    max_wait=args.max_wait_ms / 1000, max_queue_time=args.max_queue_time,
+                    max_queue=args.max_queue).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
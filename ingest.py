@@ -0,0 +1,218 @@
+"""
+Text extraction for uploaded documents.
+
+Every supported extension has an extractor that yields the document lazily, one PDF page or
+one TXT/DOCX paragraph at a time, so extraction holds a single page or paragraph of text
+instead of repeatedly copying a growing string. Sources can be raw bytes, a binary stream
+such as a werkzeug FileStorage stream, or a path on disk.
+
+Large PDFs can be extracted by a pool of processes, which is started on first use and kept
+for later documents. The workers read the PDF from its path, so an upload held in memory is
+written once to a temporary file instead of being sent to every task.
+"""
+import io
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree import ElementTree
+
+import fitz
+
+from metrics import record_size
+
+
+DEFAULT_PAGES_PER_TASK = 16
+PARALLEL_PAGE_THRESHOLD = 64
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+_pool = None
+_pool_key = None  # (pid, workers) the pool was started for
+_pool_lock = threading.Lock()
+
+
+def _as_bytes(source) -> bytes:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        return source.read()
+    with open(source, 'rb') as file:
+        return file.read()
+
+
+def _as_stream(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+
+def _open_pdf(source) -> fitz.Document:
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype='pdf')
+
+
+def _extract_pdf_range(path: str, start: int, stop: int) -> list[str]:
+    with fitz.open(path) as document:
+        return [document.load_page(page_num).get_text("text") for page_num in range(start, stop)]
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the page extraction pool of this process, starting it on first use or when the
+    number of workers changed. A pool inherited from a parent process is never reused.
+    """
+    global _pool, _pool_key
+    with _pool_lock:
+        key = (os.getpid(), workers)
+        if _pool_key != key:
+            if _pool is not None and _pool_key[0] == key[0]:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_key = key
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is pool:
+            _pool = _pool_key = None
+    pool.shutdown(wait=False)
+
+
+def iter_pdf_pages(source, workers: int = 0, pages_per_task: int = DEFAULT_PAGES_PER_TASK):
+    """
+    Yields the text of every page of a PDF, in order.
+
+    :param source: The PDF as bytes, a binary stream or a path.
+    :param workers: When greater than zero and the document has at least
+                    PARALLEL_PAGE_THRESHOLD pages, pages are extracted by this many processes,
+                    pages_per_task pages at a time.
+    :type workers: int
+    :param pages_per_task: Number of pages each parallel task extracts.
+    :type pages_per_task: int
+    :return: A generator of page texts.
+    :rtype: Iterator[str]
+    """
+    if not isinstance(source, str):
+        source = _as_bytes(source)  # fitz needs the whole PDF in memory, read the stream once
+    with _open_pdf(source) as document:
+        page_count = document.page_count
+        record_size('pages', page_count)
+        if workers <= 0 or page_count < PARALLEL_PAGE_THRESHOLD:
+            for page_num in range(page_count):
+                yield document.load_page(page_num).get_text("text")
+            return
+    starts = range(0, page_count, pages_per_task)
+    stops = [min(start + pages_per_task, page_count) for start in starts]
+    path = source
+    if not isinstance(source, str):
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as file:
+            file.write(source)
+        path = file.name
+    try:
+        pool = _get_pool(workers)
+        for pages in pool.map(_extract_pdf_range, [path] * len(starts), starts, stops):
+            yield from pages
+    except BrokenProcessPool:
+        _discard_pool(pool)  # A worker died; the next document starts a fresh pool
+        raise
+    finally:
+        if path is not source:
+            os.unlink(path)
+
+
+def iter_txt_paragraphs(source, encoding: str = 'utf-8-sig'):
+    """
+    Yields the blank-line separated paragraphs of a text file, reading it line by line.
+
+    :param source: The file as bytes, a binary stream or a path.
+    :param encoding: The text encoding. The default reads UTF-8 and drops a leading byte order
+                     mark. Undecodable bytes are replaced.
+    :type encoding: str
+    :return: A generator of paragraphs.
+    :rtype: Iterator[str]
+    """
+    if isinstance(source, str):
+        stream = open(source, encoding=encoding, errors='replace')
+    else:
+        stream = io.TextIOWrapper(_as_stream(source), encoding=encoding, errors='replace')
+    try:
+        paragraph = []
+        for line in stream:
+            if line.strip():
+                paragraph.append(line)
+            elif paragraph:
+                yield "".join(paragraph)
+                paragraph = []
+        if paragraph:
+            yield "".join(paragraph)
+    finally:
+        if isinstance(source, str):
+            stream.close()
+        else:
+            stream.detach()  # Leave the caller's stream open
+
+
+def iter_docx_paragraphs(source):
+    """
+    Yields the non-empty paragraphs of a DOCX document by streaming word/document.xml,
+    without loading the whole XML tree.
+
+    :param source: The document as bytes, a binary stream or a path.
+    :return: A generator of paragraphs.
+    :rtype: Iterator[str]
+    """
+    with zipfile.ZipFile(source if isinstance(source, str) else _as_stream(source)) as archive, \
+            archive.open('word/document.xml') as xml:
+        runs = []
+        for _, element in ElementTree.iterparse(xml, events=('end',)):
+            if element.tag == WORD_NAMESPACE + 't':
+                runs.append(element.text or "")
+            elif element.tag == WORD_NAMESPACE + 'tab':
+                runs.append("\t")
+            elif element.tag == WORD_NAMESPACE + 'p':
+                paragraph = "".join(runs)
+                runs = []
+                element.clear()
+                if paragraph.strip():
+                    yield paragraph + "\n"
+
+
+EXTRACTORS = {
+    'pdf': iter_pdf_pages,
+    'txt': iter_txt_paragraphs,
+    'docx': iter_docx_paragraphs,
+}
+
+
+def iter_text(source, extension: str, workers: int = 0):
+    """
+    Yields the text of a document piece by piece with the extractor of its extension.
+
+    :param source: The document as bytes, a binary stream or a path.
+    :param extension: The file extension, e.g. 'pdf'.
+    :type extension: str
+    :param workers: Number of processes for parallel page extraction of large PDFs.
+                    Ignored for other document types.
+    :type workers: int
+    :return: A generator of pages or paragraphs.
+    :rtype: Iterator[str]
+    :raises ValueError: If the extension has no extractor.
+    """
+    extractor = EXTRACTORS.get(extension.lower())
+    if extractor is None:
+        raise ValueError('Unsupported document type: {}'.format(extension))
+    if extractor is iter_pdf_pages:
+        return extractor(source, workers=workers)
+    return extractor(source)
+
+
+def extract_text(source, extension: str, workers: int = 0) -> str:
+    """
+    Returns the full text of a document, joined once from the pieces of iter_text.
+    """
+    return "\n".join(iter_text(source, extension, workers=workers))
@@ -0,0 +1,303 @@
+"""
+Background summarization jobs.
+
+Uploads are recorded in the jobs table and handed to a bounded pool of worker processes.
+Each worker loads the models once, when it starts, and keeps them for every job it runs.
+Job state lives in SQLite so that any web worker can answer status requests.
+
+Every web worker process has its own JobQueue and therefore its own pool, so a server runs
+SARA_WEB_WORKERS x SARA_JOB_WORKERS job processes, each with a model copy unless an inference
+server holds the model.
+
+A job's upload lives only in the pool of the process that submitted it. Every job records its
+owner, an id held by one server through a lock file for as long as any of its processes is
+alive, so a starting server can fail the jobs of servers that are gone without touching those
+of servers still running.
+"""
+import fcntl
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from database import get_connection, save_article
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 3
+INTERRUPTED_ERROR = 'Interrupted by a server restart'
+OWNER_ENV = 'SARA_JOB_OWNER'  # Passes the owner of a server to the workers it starts
+
+_owner = None  # (pid, owner, lock file) of the owner this process claimed
+_owner_lock = threading.Lock()
+
+
+def _update(db_path, job_id, **fields):
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute(f'UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                     (*fields.values(), job_id))
+
+
+def _owner_lock_path(db_path, owner):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'job-owners', owner + '.lock')
+
+
+def claim_ownership(db_path: str) -> str:
+    """
+    Creates a new owner for the jobs this process and the processes it forks submit from now
+    on, and holds its lock file until all of them exit. Call it once per server start, in the
+    process that starts the web workers.
+
+    :param db_path: Path of the SQLite database file; the lock files live next to it.
+    :type db_path: str
+    :return: The owner id.
+    :rtype: str
+    """
+    global _owner
+    with _owner_lock:
+        owner = uuid.uuid4().hex
+        path = _owner_lock_path(db_path, owner)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock_file = open(path, 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)  # Shared with forked processes, released when the last one exits
+        _owner = (os.getpid(), owner, lock_file)
+        os.environ[OWNER_ENV] = owner
+    return owner
+
+
+def current_owner(db_path: str) -> str:
+    """
+    :return: The owner of the server this process belongs to, claimed for this process alone
+             when it was not started by a server that claimed one.
+    :rtype: str
+    """
+    owner = os.environ.get(OWNER_ENV)
+    if owner is not None:
+        return owner
+    return claim_ownership(db_path)
+
+
+def _is_owner_alive(db_path, owner):
+    try:
+        lock_file = open(_owner_lock_path(db_path, owner))
+    except FileNotFoundError:
+        return False
+    with lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        return False
+
+
+def _init_worker():
+    """
+    Runs once in every worker process and loads the models it will keep for its lifetime.
+    Workers forked from a process that already warmed up inherit its loaded model. With an
+    inference server the workers load only the tokenizer and send generation to the server.
+    """
+    import nlp_resources
+    import summ
+
+    nlp_resources.preload()
+    summ.get_tokenizer()
+    if summ.get_inference_client() is None:
+        summ.get_model()
+
+
+def _run_job(db_path, job_id, filename, source, extension, cache_key, settings, max_attempts):
+    """
+    Summarizes one upload inside a worker process. Failed attempts are retried up to
+    max_attempts times before the job is marked failed; a document without a summary fails
+    at once.
+
+    :return: The final status of the job and the trace of its stages and input sizes, which
+             the web process adds to its metrics.
+    :rtype: tuple[str, metrics.Trace]
+    """
+    from pipeline import EmptySummary, summarize_document
+    from summary_cache import SummaryCache
+
+    with metrics.trace() as trace:
+        for attempt in range(1, max_attempts + 1):
+            _update(db_path, job_id, status=RUNNING, attempts=attempt)
+            try:
+                summary = summarize_document(source, extension, **settings)
+            except EmptySummary as e:
+                _update(db_path, job_id, error=str(e))
+                break  # The same document gives the same result
+            except Exception as e:
+                _update(db_path, job_id, error=repr(e))
+                continue
+            with metrics.stage('save_article'):
+                SummaryCache(db_path).put(cache_key, summary)
+                save_article(filename, summary, db_path)
+            _update(db_path, job_id, status=DONE, summary=summary, error=None, timings=json.dumps(trace.stages))
+            return DONE, trace
+        _update(db_path, job_id, status=FAILED, timings=json.dumps(trace.stages))
+    return FAILED, trace
+
+
+class JobQueue:
+    def __init__(self, db_path: str, max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, start_method: str = 'spawn'):
+        """
+        Creates a job queue backed by the jobs table of the given SQLite database. The worker
+        pool is started on the first submission, so importing the web app does not spawn it.
+
+        :param db_path: Path of the SQLite database file.
+        :type db_path: str
+        :param max_workers: Number of worker processes, each holding its own model.
+        :type max_workers: int
+        :param max_attempts: How many times a job is tried before it is marked failed.
+        :type max_attempts: int
+        :param start_method: multiprocessing start method of the workers. Use 'fork' after
+                             summ.load() so that workers share the loaded weights
+                             copy-on-write instead of each loading its own copy, and call
+                             start before the process starts any thread.
+        :type start_method: str
+        """
+        self.__db_path = db_path
+        self.__max_workers = max_workers
+        self.__max_attempts = max_attempts
+        self.__start_method = start_method
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        with self.__lock:
+            if self.__executor is None:
+                start_method = self.__start_method
+                if start_method == 'fork' and threading.active_count() > 1:
+                    # Forking a threaded process can copy locks held by other threads, so the
+                    # workers start from a fork server instead and load their own models
+                    start_method = 'forkserver'
+                self.__executor = ProcessPoolExecutor(max_workers=self.__max_workers,
+                                                      mp_context=multiprocessing.get_context(start_method),
+                                                      initializer=_init_worker)
+            return self.__executor
+
+    def start(self) -> None:
+        """
+        Starts the worker pool now rather than on the first submission. A fork pool forks all
+        of its workers at once, which is only safe while the calling process has no other
+        thread, so with the 'fork' start method call this right after the process starts. A
+        pool started later, or restarted after a worker died, uses a fork server instead.
+        """
+        self.__get_executor().submit(os.getpid)  # Launches the workers
+
+    def submit(self, filename: str, source, extension: str, cache_key: str, settings: dict,
+               on_done=None) -> str:
+        """
+        Records a queued job and hands it to the worker pool.
+
+        :param filename: The name the article is stored under.
+        :type filename: str
+        :param source: The uploaded document as bytes, or a path the workers can read.
+        :param extension: The file extension of the upload.
+        :type extension: str
+        :param cache_key: The summary cache key of the upload.
+        :type cache_key: str
+        :param settings: Keyword arguments for pipeline.summarize_document.
+        :type settings: dict
+        :param on_done: Called without arguments once the job has finished or failed.
+        :type on_done: Callable[[], None] | None
+        :return: The job id.
+        :rtype: str
+        """
+        job_id = uuid.uuid4().hex
+        conn = get_connection(self.__db_path)
+        with conn:
+            conn.execute('INSERT INTO jobs (id, filename, status, owner) VALUES (?, ?, ?, ?)',
+                         (job_id, filename, QUEUED, current_owner(self.__db_path)))
+        args = (_run_job, self.__db_path, job_id, filename, source, extension, cache_key, settings,
+                self.__max_attempts)
+        try:
+            future = self.__get_executor().submit(*args)
+        except BrokenProcessPool:
+            self.__reset_executor()  # A worker died; start a fresh pool for this and later jobs
+            future = self.__get_executor().submit(*args)
+        metrics.JOBS_IN_FLIGHT.inc()
+        future.add_done_callback(lambda f: self.__on_done(job_id, f, on_done))
+        return job_id
+
+    def __reset_executor(self):
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=False)
+                self.__executor = None
+
+    def __on_done(self, job_id, future, on_done):
+        metrics.JOBS_IN_FLIGHT.dec()
+        if on_done is not None:
+            on_done()
+        if future.cancelled():
+            return
+        # Ordinary errors are retried inside the worker; this catches a worker that died.
+        if future.exception() is not None:
+            _update(self.__db_path, job_id, status=FAILED, error=repr(future.exception()))
+            metrics.JOBS.inc(FAILED)
+            return
+        status, trace = future.result()
+        metrics.observe(trace)
+        metrics.JOBS.inc(status)
+
+    def fail_interrupted(self) -> int:
+        """
+        Marks the jobs left queued or running by servers that are gone as failed. Their uploads
+        lived only in the worker pools of those servers, so they can never finish, and the page
+        polling them would wait forever. Jobs of servers that are still running, such as the
+        old server during a gunicorn upgrade, are left alone.
+
+        :return: The number of jobs marked failed.
+        :rtype: int
+        """
+        conn = get_connection(self.__db_path)
+        owners = [row[0] for row in conn.execute('SELECT DISTINCT owner FROM jobs WHERE status IN (?, ?)',
+                                                 (QUEUED, RUNNING))]
+        failed = 0
+        for owner in owners:
+            if owner is not None and _is_owner_alive(self.__db_path, owner):
+                continue
+            with conn:
+                failed += conn.execute('UPDATE jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP '
+                                       'WHERE status IN (?, ?) AND owner IS ?',
+                                       (FAILED, INTERRUPTED_ERROR, QUEUED, RUNNING, owner)).rowcount
+            if owner is not None:
+                try:
+                    os.remove(_owner_lock_path(self.__db_path, owner))
+                except FileNotFoundError:
+                    pass  # Removed by another server starting at the same time
+        return failed
+
+    def get(self, job_id: str) -> dict | None:
+        """
+        :param job_id: A job id returned by submit.
+        :type job_id: str
+        :return: The job row as a dictionary, or None if there is no such job.
+        :rtype: dict | None
+        """
+        row = get_connection(self.__db_path).execute(
+            'SELECT id, filename, status, attempts, summary, error, timings FROM jobs WHERE id = ?',
+            (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the worker pool, if it was started.
+        """
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=wait)
+                self.__executor = None
@@ -0,0 +1,356 @@
+"""
+Request and pipeline metrics in the Prometheus text format.
+
+The pipeline marks its stages with stage() and its input sizes with record_size(). Both only
+append to the Trace of the current request or job, if there is one, so library code pays a
+context variable lookup and nothing else when it runs outside the web app. The app turns the
+trace into a Server-Timing header and observes it into the histograms of REGISTRY, which
+/metrics renders. Jobs run in worker processes and return their trace, which the web process
+observes when the job finishes.
+
+Metric values live in process memory. Under gunicorn every worker process has its own values;
+set SARA_METRICS_DIR to a directory shared by the workers and each of them writes a snapshot
+there about once a second, and /metrics adds up the snapshots of all workers. Empty the
+directory when the server starts, as snapshots of earlier runs are added up too.
+"""
+import atexit
+import bisect
+import contextlib
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000,
+                200000, 500000, 1000000, 2000000, 5000000)
+FLUSH_INTERVAL = 1.0
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Trace:
+    """
+    The stage durations and input sizes of one request or job, in the order they happened.
+    """
+    __slots__ = ('stages', 'sizes')
+
+    def __init__(self, stages=None, sizes=None):
+        self.stages = stages if stages is not None else []
+        self.sizes = sizes if sizes is not None else []
+
+
+_current = contextvars.ContextVar('sara_trace', default=None)
+
+
+@contextlib.contextmanager
+def trace():
+    """
+    Collects the stages and sizes recorded in the block into a new Trace, which is yielded.
+    """
+    current = Trace()
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+
+
+def start_trace() -> tuple[Trace, contextvars.Token]:
+    """
+    Like trace(), for callers that start and end the trace in different functions, such as
+    Flask request hooks. Pass the returned token to end_trace.
+    """
+    current = Trace()
+    return current, _current.set(current)
+
+
+def end_trace(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """
+    Records the wall time of the block as a stage of the current trace, also when it raises.
+    """
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.stages.append((name, time.perf_counter() - started))
+
+
+def record_size(unit: str, value: int) -> None:
+    """
+    Records an input size, such as 'pages', 'characters' or 'tokens', in the current trace.
+    """
+    current = _current.get()
+    if current is not None:
+        current.sizes.append((unit, value))
+
+
+def server_timing(stages) -> str:
+    """
+    Formats (name, seconds) pairs as a Server-Timing header value. Durations are in
+    milliseconds and a stage that ran several times is reported once with its total.
+    """
+    totals = {}
+    for name, seconds in stages:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in totals.items())
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labels):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def snapshot(self):
+        return {'kind': self.kind, 'help': self.documentation, 'labels': self.labels,
+                'series': [[list(key), value] for key, value in self.values.items()]}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self.registry.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+            self.registry.changes += 1
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, *label_values, amount=1):
+        with self.registry.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+            self.registry.changes += 1
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value, *label_values):
+        with self.registry.lock:
+            self.values[label_values] = value
+            self.registry.changes += 1
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels, buckets):
+        super().__init__(registry, name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)  # Buckets are inclusive upper bounds
+        with self.registry.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+            self.registry.changes += 1
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot['buckets'] = self.buckets
+        snapshot['series'] = [[key, [list(counts), total]] for key, (counts, total) in snapshot['series']]
+        return snapshot
+
+
+class Registry:
+    def __init__(self, directory: str | None = None):
+        """
+        Holds the metrics of this process.
+
+        :param directory: Directory shared by the worker processes of one server, or None to
+                          render only the metrics of this process.
+        :type directory: str | None
+        """
+        self.lock = threading.Lock()
+        self.changes = 0
+        self.__metrics = {}
+        self.__directory = directory
+        self.__writer_pid = None
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __add(self, metric):
+        self.__metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self.__add(Counter(self, name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels=()) -> Gauge:
+        return self.__add(Gauge(self, name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels=(), buckets=DURATION_BUCKETS) -> Histogram:
+        return self.__add(Histogram(self, name, documentation, labels, buckets))
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {name: metric.snapshot() for name, metric in self.__metrics.items()}
+
+    def start_writer(self) -> None:
+        """
+        Starts the thread that writes the snapshots of this process to the shared directory.
+        Call it in every process that records metrics; it does nothing without a directory
+        or when the thread of this process is already running.
+        """
+        if self.__directory is None or self.__writer_pid == os.getpid():
+            return
+        self.__writer_pid = os.getpid()
+        threading.Thread(target=self.__write_loop, name='metrics-writer', daemon=True).start()
+        atexit.register(self.__write)
+
+    def __write_loop(self):
+        written = None
+        while True:
+            if self.changes != written:
+                written = self.changes
+                self.__write()
+            time.sleep(FLUSH_INTERVAL)
+
+    def __write(self):
+        path = os.path.join(self.__directory, f'metrics-{os.getpid()}.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(path + '.tmp', path)
+
+    def __collect(self) -> dict:
+        if self.__directory is None:
+            return self.snapshot()
+        own = f'metrics-{os.getpid()}.json'
+        merged = self.snapshot()
+        for path in glob.glob(os.path.join(self.__directory, 'metrics-*.json')):
+            name = os.path.basename(path)
+            if name == own:
+                continue
+            try:
+                with open(path, encoding='utf-8') as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            _merge(merged, snapshot, live=_is_alive(int(name[len('metrics-'):-len('.json')])))
+        return merged
+
+    def render(self) -> str:
+        """
+        :return: All metrics in the Prometheus text exposition format.
+        :rtype: str
+        """
+        lines = []
+        for name, metric in self.__collect().items():
+            lines.append(f'# HELP {name} {metric["help"]}')
+            lines.append(f'# TYPE {name} {metric["kind"]}')
+            labels = metric['labels']
+            for key, value in metric['series']:
+                if metric['kind'] != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels, key)} {value}')
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip((*metric['buckets'], '+Inf'), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels((*labels, "le"), (*key, bound))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels, key)} {total}')
+                lines.append(f'{name}_count{_format_labels(labels, key)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(merged, snapshot, live):
+    # Counters and histograms of exited workers still count; their gauges no longer apply.
+    for name, metric in snapshot.items():
+        target = merged.get(name)
+        if target is None or target['kind'] != metric['kind'] or (metric['kind'] == 'gauge' and not live):
+            continue
+        series = {tuple(key): value for key, value in target['series']}
+        for key, value in metric['series']:
+            key = tuple(key)
+            current = series.get(key)
+            if current is None:
+                series[key] = value
+            elif metric['kind'] == 'histogram':
+                series[key] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+            else:
+                series[key] = current + value
+        target['series'] = [[list(key), value] for key, value in series.items()]
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + ','.join(pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+REGISTRY = Registry(os.environ.get('SARA_METRICS_DIR'))
+
+REQUEST_SECONDS = REGISTRY.histogram('sara_request_duration_seconds', 'Time spent handling HTTP requests.',
+                                     ('endpoint',))
+REQUESTS = REGISTRY.counter('sara_requests_total', 'HTTP requests by endpoint and status code.',
+                            ('endpoint', 'status'))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge('sara_requests_in_flight', 'HTTP requests being handled.', ('endpoint',))
+JOBS_IN_FLIGHT = REGISTRY.gauge('sara_jobs_in_flight', 'Summarization jobs queued or running.')
+JOBS = REGISTRY.counter('sara_jobs_total', 'Finished summarization jobs by status.', ('status',))
+STAGE_SECONDS = REGISTRY.histogram('sara_stage_duration_seconds', 'Time spent in each pipeline stage.',
+                                   ('stage',))
+INPUT_SIZE = REGISTRY.histogram('sara_input_size', 'Size of summarized inputs in pages, characters and tokens.',
+                                ('unit',), buckets=SIZE_BUCKETS)
+
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge('sara_admission_queue_depth', 'Summarization requests waiting for admission.')
+ADMISSION_RUNNING = REGISTRY.gauge('sara_admission_running', 'Admitted summarization requests not yet finished.')
+ADMISSION_COST_IN_USE = REGISTRY.gauge('sara_admission_cost_in_use', 'Estimated cost of the admitted requests.',
+                                       ('unit',))
+ADMISSION_REJECTIONS = REGISTRY.counter('sara_admission_rejections_total',
+                                        'Summarization requests rejected with 503 by reason.', ('reason',))
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram('sara_admission_wait_seconds',
+                                            'Time admitted requests waited for admission.')
+
+
+def observe(current: Trace) -> None:
+    """
+    Adds the stages of a finished trace to the stage histogram, and its sizes, totalled per
+    unit, to the input size histogram. The tokens of a document summarized in several model
+    calls are therefore observed once, as the number of tokens the encoder processed.
+    """
+    for name, seconds in current.stages:
+        STAGE_SECONDS.observe(seconds, name)
+    totals = {}
+    for unit, value in current.sizes:
+        totals[unit] = totals.get(unit, 0) + value
+    for unit, value in totals.items():
+        INPUT_SIZE.observe(value, unit)
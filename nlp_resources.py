@@ -0,0 +1,142 @@
+"""
+Process-wide registry of the NLTK data used by Summarizer.
+
+Stop word sets and Punkt sentence tokenizers are loaded from the local nltk_data
+directories at most once per language per process and shared by every Summarizer.
+NLTK itself is imported on first use. Nothing here downloads data on the request path;
+provision nltk_data ahead of time with
+
+    python nlp_resources.py --download
+"""
+import argparse
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from nltk.tokenize.punkt import PunktTokenizer
+
+
+DEFAULT_STOP_WORDS_LANGUAGE = 'turkish'
+DEFAULT_PUNKT_LANGUAGE = 'english'
+SUPPORTED_LANGUAGES = ('english', 'turkish')
+NLTK_PACKAGES = ('stopwords', 'punkt_tab')
+
+_lock = threading.Lock()
+_stop_words: dict[str, frozenset[str]] = {}
+_sentence_tokenizers: dict[str, 'PunktTokenizer'] = {}
+
+
+def stop_words_language(lang: str) -> str:
+    """
+    Maps a Summarizer language name to the NLTK stop words list it uses. Names that are not
+    an NLTK language, such as "turkish-english-summarizer", use the Turkish list.
+
+    :param lang: The language passed to Summarizer.
+    :type lang: str
+    :return: The NLTK stop words file id.
+    :rtype: str
+    """
+    return lang if lang in SUPPORTED_LANGUAGES else DEFAULT_STOP_WORDS_LANGUAGE
+
+
+def punkt_language(lang: str) -> str:
+    """
+    Maps a Summarizer language name to the Punkt model it uses. Names that are not an NLTK
+    language fall back to the English model, which is what sent_tokenize uses by default.
+
+    :param lang: The language passed to Summarizer.
+    :type lang: str
+    :return: The Punkt model name.
+    :rtype: str
+    """
+    return lang if lang in SUPPORTED_LANGUAGES else DEFAULT_PUNKT_LANGUAGE
+
+
+def get_stop_words(language: str) -> frozenset[str]:
+    """
+    Returns the shared, immutable stop words set for the given NLTK language, reading it from
+    the local nltk_data on first use. Nothing is downloaded; a missing corpus is an error, like
+    missing Punkt data, so preload() fails at startup instead of serving summaries scored
+    without stop words.
+
+    :param language: The NLTK stop words file id, e.g. 'turkish'.
+    :type language: str
+    :return: The stop words of the language.
+    :rtype: frozenset[str]
+    :raises LookupError: If the stop words corpus is not installed.
+    """
+    words = _stop_words.get(language)
+    if words is None:
+        with _lock:
+            words = _stop_words.get(language)
+            if words is None:
+                from nltk.corpus import stopwords
+
+                try:
+                    words = frozenset(stopwords.words(language))
+                except OSError as e:
+                    raise LookupError('Could not load stopwords file: {}'.format(e)) from e
+                _stop_words[language] = words
+    return words
+
+
+def get_sentence_tokenizer(language: str) -> 'PunktTokenizer':
+    """
+    Returns the shared Punkt sentence tokenizer for the given language, loading its parameters
+    from the local nltk_data on first use.
+
+    :param language: The Punkt model name, e.g. 'english'.
+    :type language: str
+    :return: The sentence tokenizer of the language.
+    :rtype: PunktTokenizer
+    :raises LookupError: If the Punkt data is not installed.
+    """
+    tokenizer = _sentence_tokenizers.get(language)
+    if tokenizer is None:
+        with _lock:
+            tokenizer = _sentence_tokenizers.get(language)
+            if tokenizer is None:
+                from nltk.tokenize.punkt import PunktTokenizer
+
+                tokenizer = PunktTokenizer(language)
+                _sentence_tokenizers[language] = tokenizer
+    return tokenizer
+
+
+def preload(langs=('turkish-english-summarizer',)) -> None:
+    """
+    Loads the resources of the given Summarizer languages so that missing data is reported
+    when a worker starts instead of on its first request.
+
+    :param langs: The languages Summarizer will be constructed with.
+    :type langs: Iterable[str]
+    :raises LookupError: If the stop words or the Punkt data of a language are not installed.
+    """
+    for lang in langs:
+        get_stop_words(stop_words_language(lang))
+        get_sentence_tokenizer(punkt_language(lang))
+
+
+def download(download_dir=None) -> None:
+    """
+    Downloads the NLTK packages Summarizer needs. Meant for image builds and provisioning,
+    never for the request path.
+
+    :param download_dir: Optional nltk_data directory to download into.
+    :type download_dir: str
+    """
+    import nltk
+
+    for package in NLTK_PACKAGES:
+        nltk.download(package, download_dir=download_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Provision or check the NLTK data used by Summarizer.")
+    parser.add_argument("--download", action="store_true", help="Download the required NLTK packages first.")
+    parser.add_argument("--download-dir", default=None)
+    args = parser.parse_args()
+    if args.download:
+        download(args.download_dir)
+    preload(SUPPORTED_LANGUAGES)
+    print("NLTK resources are available.")
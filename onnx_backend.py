@@ -0,0 +1,149 @@
+"""
+ONNX Runtime backend for the bert2bert summarizer.
+
+The encoder and the decoder of the EncoderDecoderModel are exported as two ONNX graphs with
+dynamic batch and sequence axes. OnnxEncoderDecoder runs them with onnxruntime and exposes the
+generate(input_ids, attention_mask=...) call that summ.generate_summaries uses, so the backend
+is a drop-in replacement for the PyTorch model. Decoding is greedy and recomputes the decoder
+over the whole prefix at every step; benchmarks/compare_backends.py measures the effect on
+latency and on agreement with the torch backend.
+
+Export once, then start the app with SARA_BACKEND=onnx:
+
+    python onnx_backend.py --output models/bert2bert-onnx
+"""
+import argparse
+import os
+
+import numpy as np
+import torch
+
+from summ import DEFAULT_ONNX_DIR, ckpt
+
+
+ENCODER_FILE = 'encoder.onnx'
+DECODER_FILE = 'decoder.onnx'
+DEFAULT_OPSET = 14
+
+
+class _Encoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.encoder = model.encoder
+        self.enc_to_dec_proj = getattr(model, 'enc_to_dec_proj', None)
+
+    def forward(self, input_ids, attention_mask):
+        hidden_states = self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        if self.enc_to_dec_proj is not None:
+            hidden_states = self.enc_to_dec_proj(hidden_states)
+        return hidden_states
+
+
+class _Decoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.decoder = model.decoder
+
+    def forward(self, decoder_input_ids, encoder_hidden_states, encoder_attention_mask):
+        return self.decoder(input_ids=decoder_input_ids, encoder_hidden_states=encoder_hidden_states,
+                            encoder_attention_mask=encoder_attention_mask).logits
+
+
+def export(model, output_dir=DEFAULT_ONNX_DIR, opset=DEFAULT_OPSET):
+    """
+    Exports the encoder and decoder of an EncoderDecoderModel to output_dir.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    model = model.to('cpu').eval()
+    input_ids = torch.ones((1, 8), dtype=torch.long)
+    attention_mask = torch.ones((1, 8), dtype=torch.long)
+    with torch.inference_mode():
+        hidden_states = _Encoder(model)(input_ids, attention_mask)
+    torch.onnx.export(_Encoder(model), (input_ids, attention_mask), os.path.join(output_dir, ENCODER_FILE),
+                      input_names=['input_ids', 'attention_mask'], output_names=['encoder_hidden_states'],
+                      dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                                    'attention_mask': {0: 'batch', 1: 'sequence'},
+                                    'encoder_hidden_states': {0: 'batch', 1: 'sequence'}},
+                      opset_version=opset)
+    decoder_input_ids = torch.ones((1, 2), dtype=torch.long)
+    torch.onnx.export(_Decoder(model), (decoder_input_ids, hidden_states, attention_mask),
+                      os.path.join(output_dir, DECODER_FILE),
+                      input_names=['decoder_input_ids', 'encoder_hidden_states', 'encoder_attention_mask'],
+                      output_names=['logits'],
+                      dynamic_axes={'decoder_input_ids': {0: 'batch', 1: 'decoded'},
+                                    'encoder_hidden_states': {0: 'batch', 1: 'sequence'},
+                                    'encoder_attention_mask': {0: 'batch', 1: 'sequence'},
+                                    'logits': {0: 'batch', 1: 'decoded'}},
+                      opset_version=opset)
+
+
+class OnnxEncoderDecoder:
+    def __init__(self, model_dir, decoder_start_token_id, eos_token_id, pad_token_id, max_length,
+                 num_threads=None):
+        """
+        Loads the exported encoder and decoder into CPU onnxruntime sessions.
+
+        :param model_dir: Directory written by export.
+        :type model_dir: str
+        :param decoder_start_token_id: First token fed to the decoder.
+        :param eos_token_id: Token, or list of tokens, that ends a summary.
+        :param pad_token_id: Token written after a summary has ended.
+        :param max_length: Maximum summary length in tokens, including the start token.
+        :param num_threads: Intra-op threads per session; onnxruntime picks when None.
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        providers = ['CPUExecutionProvider']
+        self.encoder = ort.InferenceSession(os.path.join(model_dir, ENCODER_FILE), options, providers=providers)
+        self.decoder = ort.InferenceSession(os.path.join(model_dir, DECODER_FILE), options, providers=providers)
+        self.decoder_start_token_id = decoder_start_token_id
+        self.eos_token_ids = np.atleast_1d(np.asarray(eos_token_id, dtype=np.int64))
+        self.pad_token_id = pad_token_id
+        self.max_length = max_length
+
+    def generate(self, input_ids, attention_mask=None, max_length=None, streamer=None):
+        """
+        Greedily decodes a batch. A transformers streamer, as used by summ.stream_summary,
+        receives the start token and then every generated token.
+        """
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        input_ids = input_ids.cpu().numpy().astype(np.int64)
+        attention_mask = attention_mask.cpu().numpy().astype(np.int64)
+        hidden_states = self.encoder.run(None, {'input_ids': input_ids, 'attention_mask': attention_mask})[0]
+        batch_size = input_ids.shape[0]
+        decoded = np.full((batch_size, 1), self.decoder_start_token_id, dtype=np.int64)
+        finished = np.zeros(batch_size, dtype=bool)
+        if streamer is not None:
+            streamer.put(torch.from_numpy(decoded))
+        for _ in range((max_length or self.max_length) - 1):
+            logits = self.decoder.run(None, {'decoder_input_ids': decoded,
+                                             'encoder_hidden_states': hidden_states,
+                                             'encoder_attention_mask': attention_mask})[0]
+            next_tokens = logits[:, -1, :].argmax(axis=-1)
+            next_tokens[finished] = self.pad_token_id
+            decoded = np.concatenate([decoded, next_tokens[:, None]], axis=1)
+            if streamer is not None:
+                streamer.put(torch.from_numpy(next_tokens))
+            finished |= np.isin(next_tokens, self.eos_token_ids)
+            if finished.all():
+                break
+        if streamer is not None:
+            streamer.end()
+        return torch.from_numpy(decoded)
+
+
+if __name__ == "__main__":
+    from transformers import EncoderDecoderModel
+
+    parser = argparse.ArgumentParser(description="Export the summarization model to ONNX.")
+    parser.add_argument("--checkpoint", default=ckpt)
+    parser.add_argument("--output", default=DEFAULT_ONNX_DIR)
+    parser.add_argument("--opset", type=int, default=DEFAULT_OPSET)
+    args = parser.parse_args()
+    export(EncoderDecoderModel.from_pretrained(args.checkpoint), args.output, args.opset)
+    print("Exported to {}".format(args.output))
@@ -0,0 +1,79 @@
+from ingest import extract_text
+from metrics import record_size, stage
+from summarize import Summarizer
+from summ import (DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_TOKENS, DEFAULT_MAX_DEPTH, count_tokens,
+                  generate_long_summary, get_inference_client, stream_summary)
+
+
+class EmptySummary(ValueError):
+    """
+    The document has no text to summarize, or the model returned an empty summary. Empty
+    summaries are never stored or cached, and retrying does not help.
+    """
+
+
+def _extract(source, extension, pdf_workers):
+    with stage('extract'):
+        text = extract_text(source, extension, workers=pdf_workers)
+    record_size('characters', len(text))
+    return text
+
+
+def _reduce(text, token_budget):
+    summarizer = Summarizer("turkish-english-summarizer")
+    with stage('extractive'):
+        if token_budget:
+            return summarizer.select(text, token_budget, count_tokens)
+        return summarizer.summarize(text)
+
+
+def summarize_document(source, extension, chunk_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_CHUNK_OVERLAP,
+                       max_depth=DEFAULT_MAX_DEPTH, pdf_workers=0, token_budget=None):
+    """
+    Extracts the text of a document, reduces it extractively and summarizes the result with
+    the model. With a token_budget the extractive stage selects the best sentences that fit in
+    that many model tokens (Summarizer.select); otherwise every sentence scoring well above
+    the average is kept (Summarizer.summarize) and long results are summarized in chunks.
+
+    :raises EmptySummary: If there is nothing to summarize or the summary is empty.
+    """
+    summarized_text = _reduce(_extract(source, extension, pdf_workers), token_budget)
+    if not summarized_text.strip():
+        raise EmptySummary('The document has no text to summarize')
+    with stage('generate'):
+        summary = generate_long_summary(summarized_text, chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens,
+                                        max_depth=max_depth)
+    if not summary.strip():
+        raise EmptySummary('The model returned an empty summary')
+    return summary
+
+
+def stream_document(source, extension, chunk_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_CHUNK_OVERLAP,
+                    max_depth=DEFAULT_MAX_DEPTH, pdf_workers=0, token_budget=None):
+    """
+    Summarizes a document like summarize_document with the same arguments, and yields its
+    progress as (event, data) pairs: ('progress', dict) after extraction and after the
+    extractive stage, then ('token', str) for every piece of the summary. When the extractive
+    selection fits in one chunk the pieces are streamed from the model as it decodes them;
+    otherwise, and when an inference server holds the model, the summary is yielded as a
+    single piece once it is complete. Raises
+    EmptySummary, after the last piece, when the summary is empty.
+    """
+    text = _extract(source, extension, pdf_workers)
+    yield 'progress', {'stage': 'extract', 'characters': len(text)}
+    summarized_text = _reduce(text, token_budget)
+    yield 'progress', {'stage': 'extractive', 'characters': len(summarized_text)}
+    if not summarized_text.strip():
+        raise EmptySummary('The document has no text to summarize')
+    generated = False
+    with stage('generate'):
+        if token_budget and token_budget <= chunk_tokens and get_inference_client() is None:
+            pieces = stream_summary(summarized_text)
+        else:
+            pieces = [generate_long_summary(summarized_text, chunk_tokens=chunk_tokens,
+                                            overlap_tokens=overlap_tokens, max_depth=max_depth)]
+        for piece in pieces:
+            generated = generated or bool(piece.strip())
+            yield 'token', piece
+    if not generated:
+        raise EmptySummary('The model returned an empty summary')
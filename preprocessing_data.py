@@ -1,81 +1,183 @@
-from langdetect import detect
+"""
+Separates the bilingual summaries of an export into Turkish and English workbooks.
+
+    python preprocessing_data.py data/deep_learning_summaries.xlsx \
+        --tr-output data/tr_summaries.xlsx --en-output data/en_summaries.xlsx --workers 4
+
+The input is streamed in read-only mode and both outputs are written in write-only mode in
+the same pass, so memory does not grow with the export. Language detection runs on a worker
+pool with a fixed langdetect seed, and repeated segments are detected only once per worker.
+"""
+import argparse
+import functools
+import multiprocessing
+import os
+import time
+
 import openpyxl
+from langdetect import DetectorFactory, detect
+from langdetect.lang_detect_exception import LangDetectException
 from openpyxl.workbook import Workbook
 
 
+DETECT_SEED = 0
+DETECT_CACHE_SIZE = 65536
+DEFAULT_CHUNKSIZE = 64
+PROGRESS_EVERY = 1000
+
+
+def _seed_detector():
+    DetectorFactory.seed = DETECT_SEED
+
+
+@functools.lru_cache(maxsize=DETECT_CACHE_SIZE)
+def detect_language(text):
+    try:
+        return detect(text)
+    except LangDetectException:
+        return None
+
+
+def iter_summaries(path):
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        ws = wb.active
+        for row in ws.iter_rows(values_only=True):
+            yield from row
+    finally:
+        wb.close()
+
+
 def get_summaries(path):
-    wb = openpyxl.load_workbook(path)
-    ws = wb.active
-    _summaries = []
-    for row in ws.iter_rows():
-        for cell in row:
-            _summaries.append(cell.value)
-    return _summaries
+    return list(iter_summaries(path))
+
+
+def split_summary(summary):
+    """
+    Returns the (turkish_part, english_part) tagged in a summary. A part is None when its tag
+    is missing; both are None when the summary has no tags.
+    """
+    if "[TR] " in summary and "[EN] " in summary:
+        index_tr = summary.find("[TR] ")
+        index_en = summary.find("[EN] ")
+        if index_tr < index_en:
+            parts = summary.split('[TR] ')[1].split('[EN]')
+            return parts[0].strip(), parts[1].strip()
+        parts = summary.split('[EN]')[1].split('[TR]')
+        return parts[1].strip(), parts[0].strip()
+    if "[TR] " in summary:
+        return summary.removeprefix("[TR] "), None
+    if "[EN] " in summary:
+        return None, summary.removeprefix("[EN] ")
+    return None, None
+
+
+def classify_summary(summary):
+    """
+    Sorts the parts of one summary into Turkish and English by their detected language.
+
+    :return: A tuple of the Turkish parts, the English parts and a warning message or None.
+    :rtype: tuple[list[str], list[str], str | None]
+    """
+    if not isinstance(summary, str):
+        return [], [], None
+    turkish_part, english_part = split_summary(summary)
+    if turkish_part is not None and english_part is not None:
+        lang = detect_language(turkish_part)
+        if lang == "tr":
+            return [turkish_part], [english_part], None
+        if lang == "en":
+            return [english_part], [turkish_part], None
+    elif turkish_part is not None or english_part is not None:
+        part = turkish_part if turkish_part is not None else english_part
+        lang = detect_language(part)
+        if lang == "tr":
+            return [part], [], None
+        if lang == "en":
+            return [], [part], None
+    else:
+        return [], [], None
+    return [], [], "Türkçe veya İngilizce olmayan metin saptandı. Dil kodu: {}".format(lang)
 
 
 def separate_tr_en(_summaries):
+    _seed_detector()
     _tr_summaries = []
     _en_summaries = []
     for summary in _summaries:
-        try:
-            if "[TR] " in summary and "[EN] " in summary:
-                print("TREN")
-                index_tr = summary.find("[TR] ")
-                index_en = summary.find("[EN] ")
-                if index_tr < index_en:
-                    parts = summary.split('[TR] ')[1].split('[EN]')
-                    turkish_part = parts[0].strip()
-                    english_part = parts[1].strip()
-                else:
-                    parts = summary.split('[EN]')[1].split('[TR]')
-                    english_part = parts[0].strip()
-                    turkish_part = parts[1].strip()
-                lang = detect(turkish_part)
-                if lang == "tr":
-                    _tr_summaries.append(turkish_part)
-                    _en_summaries.append(english_part)
-                elif lang == "en":
-                    _tr_summaries.append(english_part)
-                    _en_summaries.append(turkish_part)
-                else:
-                    print("Türkçe veya İngilizce olmayan metin saptandı. Dil kodu: ", lang)
-            elif "[TR] " in summary:
-                print("TR")
-                turkish_part = summary.removeprefix("[TR] ")
-                lang = detect(turkish_part)
-                if lang == "tr":
-                    _tr_summaries.append(turkish_part)
-                elif lang == "en":
-                    _en_summaries.append(turkish_part)
-                else:
-                    print("Türkçe veya İngilizce olmayan metin saptandı. Dil kodu: ", lang)
-            elif "[EN] " in summary:
-                print("EN")
-                english_part = summary.removeprefix("[EN] ")
-                lang = detect(english_part)
-                if lang == "en":
-                    _en_summaries.append(english_part)
-                elif lang == "tr":
-                    _tr_summaries.append(english_part)
-                else:
-                    print("Türkçe veya İngilizce olmayan metin saptandı. Dil kodu: ", lang)
-        except TypeError as e:
-            print(e)
+        tr_parts, en_parts, warning = classify_summary(summary)
+        if warning:
+            print(warning)
+        _tr_summaries.extend(tr_parts)
+        _en_summaries.extend(en_parts)
     return _tr_summaries, _en_summaries
 
 
 def export_summaries(path, _summaries):
-    wb = Workbook()
-    ws = wb.active
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
     for summary in _summaries:
         ws.append((summary, ))
     wb.save(path)
     wb.close()
 
 
-summaries = get_summaries("data/deep_learning_summaries.xlsx")
-data = separate_tr_en(summaries)
-tr_summaries = data[0]
-en_summaries = data[1]
-export_summaries("data/tr_summaries.xlsx", tr_summaries)
-export_summaries("data/en_summaries.xlsx", en_summaries)
+def run(input_path, tr_output, en_output, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Streams the summaries of input_path through language detection into the Turkish and
+    English workbooks and prints progress counters.
+
+    :return: The number of input cells, Turkish summaries and English summaries.
+    :rtype: tuple[int, int, int]
+    """
+    tr_wb = Workbook(write_only=True)
+    en_wb = Workbook(write_only=True)
+    tr_ws = tr_wb.create_sheet()
+    en_ws = en_wb.create_sheet()
+    counts = {'cells': 0, 'tr': 0, 'en': 0, 'skipped': 0}
+    workers = workers or os.cpu_count()
+    started = time.perf_counter()
+    pool = multiprocessing.Pool(workers, initializer=_seed_detector) if workers > 1 else None
+    try:
+        if pool is None:
+            _seed_detector()
+            results = map(classify_summary, iter_summaries(input_path))
+        else:
+            results = pool.imap(classify_summary, iter_summaries(input_path), chunksize=chunksize)
+        for tr_parts, en_parts, warning in results:
+            counts['cells'] += 1
+            for part in tr_parts:
+                tr_ws.append((part, ))
+            for part in en_parts:
+                en_ws.append((part, ))
+            counts['tr'] += len(tr_parts)
+            counts['en'] += len(en_parts)
+            counts['skipped'] += warning is not None
+            if counts['cells'] % PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                print("{cells} cells ({rate:.0f}/s): {tr} TR, {en} EN, {skipped} skipped".format(
+                    rate=counts['cells'] / elapsed, **counts))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    tr_wb.save(tr_output)
+    en_wb.save(en_output)
+    print("Done in {elapsed:.1f}s: {cells} cells, {tr} TR, {en} EN, {skipped} skipped".format(
+        elapsed=time.perf_counter() - started, **counts))
+    return counts['cells'], counts['tr'], counts['en']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Separate bilingual summaries into TR and EN workbooks.")
+    parser.add_argument("input", nargs="?", default="data/deep_learning_summaries.xlsx")
+    parser.add_argument("--tr-output", default="data/tr_summaries.xlsx")
+    parser.add_argument("--en-output", default="data/en_summaries.xlsx")
+    parser.add_argument("--workers", type=int, default=None, help="Detection processes (default: CPUs)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+    run(args.input, args.tr_output, args.en_output, workers=args.workers, chunksize=args.chunksize)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,339 @@
-import torch
-from transformers import BertTokenizerFast, EncoderDecoderModel
+"""
+Abstractive summarization with the bert2bert model.
 
+Importing this module is cheap: torch, transformers and the model are loaded on first use,
+or ahead of time by load() and warm_up(). The model, tokenizer and device are also available
+as the module attributes model, tokenizer and device, which load them when accessed.
+"""
+import os
+import threading
 
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-ckpt = 'mrm8488/bert2bert_shared-turkish-summarization'
-tokenizer = BertTokenizerFast.from_pretrained(ckpt)
-model = EncoderDecoderModel.from_pretrained(ckpt).to(device)
+from metrics import record_size
+
+
+MAX_INPUT_LENGTH = 512
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_CHUNK_TOKENS = MAX_INPUT_LENGTH - 2  # Room for [CLS] and [SEP]
+DEFAULT_CHUNK_OVERLAP = 64
+DEFAULT_MAX_DEPTH = 1
+DEFAULT_ONNX_DIR = 'models/bert2bert-onnx'
+WARM_UP_TEXT = "Bu kısa metin, modelin ilk isteği beklemeden yüklenip hazırlanması için kullanılır."
+
+BACKENDS = ('torch', 'int8', 'onnx')
+
+backend = os.environ.get('SARA_BACKEND', 'torch')
+ckpt = os.environ.get('SARA_CHECKPOINT', 'mrm8488/bert2bert_shared-turkish-summarization')
+onnx_dir = os.environ.get('SARA_ONNX_DIR', DEFAULT_ONNX_DIR)  # Export loaded by the onnx backend
+inference_socket = os.environ.get('SARA_INFERENCE_SOCKET')  # Served by inference_server.py when set
+
+_lock = threading.RLock()
+_tokenizer = None
+_model = None
+_device = None
+_inference_client = None
+
+
+def __getattr__(name):
+    if name == 'model':
+        return get_model()
+    if name == 'tokenizer':
+        return get_tokenizer()
+    if name == 'device':
+        return get_device()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def _first_set(*values):
+    return next(value for value in values if value is not None)
+
+
+def set_num_threads(num_threads):
+    """
+    Sets how many CPU threads torch uses for intra-op parallelism, e.g. to split the cores
+    of a machine between several worker processes.
+    """
+    import torch
+
+    torch.set_num_threads(num_threads)
+
+
+def get_device():
+    global _device
+    if _device is None:
+        import torch
+
+        _device = 'cuda' if torch.cuda.is_available() and backend == 'torch' else 'cpu'
+    return _device
+
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        with _lock:
+            if _tokenizer is None:
+                from transformers import BertTokenizerFast
+
+                _tokenizer = BertTokenizerFast.from_pretrained(ckpt)
+    return _tokenizer
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                if os.environ.get('SARA_NUM_THREADS'):
+                    set_num_threads(int(os.environ['SARA_NUM_THREADS']))
+                _model = load_model(backend)
+    return _model
+
+
+def is_loaded():
+    return _model is not None
+
+
+def get_inference_client():
+    """
+    Returns the client of the inference server at inference_socket, or None when generation
+    runs in this process. The server's secret is read from SARA_INFERENCE_AUTHKEY.
+    """
+    global _inference_client
+    if inference_socket is None:
+        return None
+    if _inference_client is None or _inference_client.address != inference_socket:
+        with _lock:
+            if _inference_client is None or _inference_client.address != inference_socket:
+                from inference_server import InferenceClient
+
+                authkey = os.environ.get('SARA_INFERENCE_AUTHKEY')
+                if not authkey:
+                    raise RuntimeError('SARA_INFERENCE_AUTHKEY must be set to use the inference server')
+                _inference_client = InferenceClient(inference_socket, authkey.encode())
+    return _inference_client
+
+
+def load_model(name):
+    """
+    Loads the summarization model for one of BACKENDS:
+
+    - torch: the full-precision EncoderDecoderModel.
+    - int8: the same model with its Linear layers dynamically quantized to int8, CPU only.
+    - onnx: the encoder and decoder exported by onnx_backend.py, run by onnxruntime on CPU.
+      The export is read from onnx_dir, set by SARA_ONNX_DIR.
+    """
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend {}, expected one of {}'.format(name, ', '.join(BACKENDS)))
+    import torch
+    from transformers import AutoConfig, EncoderDecoderModel, GenerationConfig
+
+    if name == 'onnx':
+        from onnx_backend import OnnxEncoderDecoder
+
+        tokenizer = get_tokenizer()
+        try:
+            generation_config = GenerationConfig.from_pretrained(ckpt)
+        except OSError:
+            generation_config = GenerationConfig.from_model_config(AutoConfig.from_pretrained(ckpt))
+        return OnnxEncoderDecoder(onnx_dir,
+                                  decoder_start_token_id=_first_set(generation_config.decoder_start_token_id,
+                                                                    tokenizer.cls_token_id),
+                                  eos_token_id=_first_set(generation_config.eos_token_id, tokenizer.sep_token_id),
+                                  pad_token_id=_first_set(generation_config.pad_token_id, tokenizer.pad_token_id),
+                                  max_length=generation_config.max_length,
+                                  num_threads=int(os.environ.get('SARA_NUM_THREADS', 0)) or None)
+    loaded = EncoderDecoderModel.from_pretrained(ckpt).eval()
+    if name == 'int8':
+        return torch.ao.quantization.quantize_dynamic(loaded, {torch.nn.Linear}, dtype=torch.qint8)
+    return loaded.to(get_device())
+
+
+def load():
+    """
+    Loads the tokenizer and the model without running them. Use it rather than warm_up before
+    forking: a generation starts the OpenMP thread pool of torch, which forked children cannot
+    use. With an inference server only the tokenizer is loaded, as the server holds the model.
+
+    :return: Whether the model was loaded in this process.
+    :rtype: bool
+    """
+    get_tokenizer()
+    if get_inference_client() is not None:
+        return False
+    get_model()
+    return True
+
+
+def warm_up():
+    """
+    Loads the tokenizer and the model and runs one generation, so that the first request does
+    not pay for loading weights or for the first-call setup of the inference kernels. With an
+    inference server only the tokenizer is loaded, as the server holds the model.
+    """
+    if load():
+        generate_summary(WARM_UP_TEXT)
 
 
 def generate_summary(text):
+    return generate_summaries([text], batch_size=1)[0]
+
+
+def generate_summaries(texts, batch_size=DEFAULT_BATCH_SIZE, max_length=MAX_INPUT_LENGTH):
+    """
+    Generates an abstractive summary for every text, returned in input order. With an
+    inference server the texts are sent to it, where they are batched together with the
+    requests of other workers. They are generated here only when the server cannot be
+    reached; when it is overloaded or fails, inference_server.InferenceError is raised
+    rather than loading another copy of the model under load.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    client = get_inference_client()
+    if client is not None:
+        from inference_server import InferenceUnavailable
+
+        try:
+            return client.generate_summaries(texts, max_length=max_length)
+        except InferenceUnavailable as e:
+            print('Inference server unreachable, generating in process: {}'.format(e))
+    return generate_summaries_in_process(texts, batch_size=batch_size, max_length=max_length)
+
+
+def generate_summaries_in_process(texts, batch_size=DEFAULT_BATCH_SIZE, max_length=MAX_INPUT_LENGTH):
+    """
+    Generates an abstractive summary for every text with the model of this process, returned
+    in input order.
+
+    Inputs are tokenized once without padding and sorted by token count, so each batch holds
+    texts of similar length and is only padded up to its own longest input. Generation runs
+    under torch.inference_mode.
+    """
+    import torch
+
+    texts = list(texts)
+    if not texts:
+        return []
+    tokenizer = get_tokenizer()
+    model = get_model()
+    device = get_device()
+    input_ids = tokenizer(texts, truncation=True, max_length=max_length)['input_ids']
+    record_size('tokens', sum(len(ids) for ids in input_ids))
+    order = sorted(range(len(texts)), key=lambda i: len(input_ids[i]))
+    summaries = [None] * len(texts)
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            inputs = tokenizer.pad({'input_ids': [input_ids[i] for i in bucket]},
+                                   padding='longest', return_tensors='pt')
+            output = model.generate(inputs.input_ids.to(device),
+                                    attention_mask=inputs.attention_mask.to(device))
+            for i, summary in zip(bucket, tokenizer.batch_decode(output, skip_special_tokens=True)):
+                summaries[i] = summary
+    return summaries
+
+
+def stream_summary(text, max_length=MAX_INPUT_LENGTH):
+    """
+    Generates the abstractive summary of one text and yields it in pieces as the model decodes
+    it. The pieces join to the summary generate_summary returns. Generation runs on its own
+    thread and hands decoded text over through a transformers TextIteratorStreamer; an error
+    raised by generation is re-raised here.
+    """
+    import torch
+    from transformers import TextIteratorStreamer
+
+    tokenizer = get_tokenizer()
+    model = get_model()
+    device = get_device()
+    inputs = tokenizer(text, truncation=True, max_length=max_length, return_tensors='pt')
+    record_size('tokens', inputs.input_ids.shape[1])
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors = []
+
+    def generate():
+        try:
+            with torch.inference_mode():
+                model.generate(inputs.input_ids.to(device), attention_mask=inputs.attention_mask.to(device),
+                               streamer=streamer)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()  # Unblocks the consumer
+
+    thread = threading.Thread(target=generate, name='stream-summary', daemon=True)
+    thread.start()
+    yield from streamer
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def count_tokens(texts):
+    """
+    Returns the number of model tokens of every text, without the [CLS] and [SEP] tokens the
+    model adds around an input.
+    """
+    if not texts:
+        return []
+    return [len(ids) for ids in get_tokenizer()(list(texts), add_special_tokens=False)['input_ids']]
+
+
+def split_into_chunks(text, chunk_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_CHUNK_OVERLAP):
+    """
+    Splits text into sentence-aligned chunks of at most chunk_tokens model tokens. Each chunk
+    starts with the trailing sentences of the previous one, up to overlap_tokens, so context
+    is not lost at the boundaries. A single sentence longer than chunk_tokens becomes a chunk
+    of its own and is truncated by the model.
+
+    :raises ValueError: Unless 0 <= overlap_tokens < chunk_tokens; a larger overlap would
+                        advance every chunk by a single sentence.
+    """
+    if not 0 <= overlap_tokens < chunk_tokens:
+        raise ValueError('overlap_tokens must be at least 0 and less than chunk_tokens, got {} and {}'
+                         .format(overlap_tokens, chunk_tokens))
+    from nlp_resources import DEFAULT_PUNKT_LANGUAGE, get_sentence_tokenizer
+
+    sentences = get_sentence_tokenizer(DEFAULT_PUNKT_LANGUAGE).tokenize(text)
+    if not sentences:
+        return []
+    lengths = count_tokens(sentences)
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence, length in zip(sentences, lengths):
+        if current and current_tokens + length > chunk_tokens:
+            chunks.append(" ".join(part for part, _ in current))
+            carried = []
+            carried_tokens = 0
+            for previous, previous_length in reversed(current):
+                if carried_tokens + previous_length > min(overlap_tokens, chunk_tokens - length):
+                    break
+                carried.insert(0, (previous, previous_length))
+                carried_tokens += previous_length
+            current = carried
+            current_tokens = carried_tokens
+        current.append((sentence, length))
+        current_tokens += length
+    chunks.append(" ".join(part for part, _ in current))
+    return chunks
+
+
+def generate_long_summary(text, chunk_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_CHUNK_OVERLAP,
+                          max_depth=DEFAULT_MAX_DEPTH, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Summarizes text of any length without truncating it at the model window.
 
-   inputs = tokenizer([text], padding="max_length", truncation=True, max_length=512, return_tensors="pt")
-   input_ids = inputs.input_ids.to(device)
-   attention_mask = inputs.attention_mask.to(device)
-   output = model.generate(input_ids, attention_mask=attention_mask)
-   return tokenizer.decode(output[0], skip_special_tokens=True)
\ No newline at end of file
+    The text is split with split_into_chunks and all chunks are summarized as one batched
+    call (map). While more than one partial summary remains and fewer than max_depth reduce
+    passes have run, the concatenated partial summaries are chunked and summarized again
+    (reduce). With max_depth=0 the partial summaries are returned concatenated.
+    """
+    chunks = split_into_chunks(text, chunk_tokens, overlap_tokens)
+    if not chunks:
+        return ""
+    depth = 0
+    while True:
+        partials = generate_summaries(chunks, batch_size=batch_size)
+        if len(partials) == 1 or depth >= max_depth:
+            return " ".join(partials)
+        chunks = split_into_chunks(" ".join(partials), chunk_tokens, overlap_tokens)
+        depth += 1
@@ -1,15 +1,49 @@
-from summarize import Summarizer
+"""
+Bulk summarization of the texts in an Excel workbook.
+
+    python summarization.py data/tr_summaries.xlsx data/tr_summaries.jsonl --workers 4
+
+Cells are streamed from the workbook in read-only mode. The extractive pass of each block of
+texts runs on a process pool while the previous block goes through batched abstractive
+generation. Every finished block is appended to the JSON Lines output and flushed, and the
+output doubles as the checkpoint: a rerun skips the cells it already contains.
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import openpyxl
 
+from summarize import Summarizer
+
+
+DEFAULT_BLOCK_SIZE = 64
+DEFAULT_BATCH_SIZE = 8
+
+_summarizer = None
+
+
+def iter_texts(path):
+    """
+    Yields (row, column, text) for every non-empty text cell of the active sheet, streaming
+    the workbook in read-only mode.
+    """
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        ws = wb.active
+        for row_number, row in enumerate(ws.iter_rows(values_only=True), start=1):
+            for column_number, value in enumerate(row, start=1):
+                if isinstance(value, str) and value.strip():
+                    yield row_number, column_number, value
+    finally:
+        wb.close()
+
 
 def get_text_summary(path):
-    wb = openpyxl.load_workbook(path)
-    ws = wb.active
-    _summaries = []
-    for row in ws.iter_rows():
-        for cell in row:
-            _summaries.append(cell.value)
-    return _summaries
+    return [text for _, _, text in iter_texts(path)]
 
 
 def summarize(_text):
@@ -17,80 +51,96 @@ def summarize(_text):
     print(f"Text: {_text}\nSummary: {summ.summarize(_text)}")
 
 
+def _init_worker():
+    global _summarizer
+    _summarizer = Summarizer("turkish-english-summarizer")
+
+
+def _extract(text):
+    return _summarizer.summarize(text)
+
+
+def load_checkpoint(output_path):
+    """
+    Returns the (row, column) pairs already present in the output. A line left incomplete by
+    a killed run is cut off so that appending continues from the last complete record.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r+', encoding='utf-8') as output:
+        valid_until = 0
+        for line in iter(output.readline, ''):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            done.add((record['row'], record['column']))
+            valid_until = output.tell()
+        output.truncate(valid_until)
+    return done
+
+
+def _write_block(output, block, extractive, generate_summaries, batch_size):
+    abstractive = generate_summaries(extractive, batch_size=batch_size) if generate_summaries else [None] * len(block)
+    for (row, column, _), text_summary, summary in zip(block, extractive, abstractive):
+        output.write(json.dumps({'row': row, 'column': column, 'text_summary': text_summary, 'summary': summary},
+                                ensure_ascii=False) + "\n")
+    output.flush()
+    os.fsync(output.fileno())
+
+
+def run(input_path, output_path, workers=None, block_size=DEFAULT_BLOCK_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+        abstractive=True):
+    """
+    Summarizes every pending cell of the input workbook into the JSON Lines output.
+
+    :return: The number of cells summarized by this run.
+    :rtype: int
+    """
+    generate_summaries = None
+    if abstractive:
+        from summ import generate_summaries  # Loads the model only when it is needed
+
+    done = load_checkpoint(output_path)
+    pending = ((row, column, text) for row, column, text in iter_texts(input_path) if (row, column) not in done)
+    workers = workers or os.cpu_count()
+    chunksize = max(1, block_size // (workers * 4))
+    processed = 0
+    started = time.perf_counter()
+    with open(output_path, 'a', encoding='utf-8') as output, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        previous = None
+        while block := list(itertools.islice(pending, block_size)):
+            # Submit this block's extractive pass before generating the previous block's summaries
+            extractive = executor.map(_extract, [text for _, _, text in block], chunksize=chunksize)
+            if previous is not None:
+                _write_block(output, previous[0], list(previous[1]), generate_summaries, batch_size)
+                processed += len(previous[0])
+                elapsed = time.perf_counter() - started
+                print(f"{processed} cells, {processed / elapsed:.2f} rows/s")
+            previous = (block, extractive)
+        if previous is not None:
+            _write_block(output, previous[0], list(previous[1]), generate_summaries, batch_size)
+            processed += len(previous[0])
+    elapsed = time.perf_counter() - started
+    print(f"Done: {processed} cells in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.2f} rows/s), "
+          f"{len(done)} skipped from checkpoint")
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize every text cell of an Excel workbook.")
+    parser.add_argument("input", help="Workbook to read, e.g. data/tr_summaries.xlsx")
+    parser.add_argument("output", help="JSON Lines file to append results to; also the resume checkpoint")
+    parser.add_argument("--workers", type=int, default=None, help="Extractive worker processes (default: CPUs)")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--extractive-only", action="store_true", help="Skip abstractive generation")
+    args = parser.parse_args()
+    run(args.input, args.output, workers=args.workers, block_size=args.block_size, batch_size=args.batch_size,
+        abstractive=not args.extractive_only)
+
+
 if "__main__" == __name__:
-    summaries = get_text_summary("data/tr_summaries.xlsx")
-    summarize("""Giriş
-Türk kamuoyunda ilkokul öğrencilerinin başarısı birincil olarak sınıf
-öğretmenlerinin niteliklerine bağlanmakta (Bümen ve Ercan Özaydın,
-2013) ve sınıf öğretmenleri çocukların geleceğini biçimlendirmede etkisi
-uzun yıllar sürecek izler bırakmaktadır. Erol ve Başaran (2020),
-çocukların ilkokul döneminde aileden sonra en çok birlikte zaman
-geçirdikleri kişinin sınıf öğretmeni olduğunu belirtirken, Altuner ve
-Başaran (2017) da ilkokul öğrencilerinin sınıf öğretmenlerini anne-
-babası gibi gördüklerini, onu her açıdan örnek aldıklarını, ona
-güvenerek duygusal açıdan güçlü bir şekilde bağlandıklarını
-vurgulamıştır. Bununla birlikte sınıf öğretmenleri hem farklı yaş
-grubundaki öğrencilere hem de birden fazla derse yönelik hizmet
-verdiği için, iş yükü ve sorumluluğu ağır bir görev yapmaktadır. Bu
-nedenle, sınıf öğretmenlerinin belli sınıf düzeylerinde ya da derslerde
-uzmanlaşmasının daha işlevsel olup olmadığı uzun zamandır tartışılan
-bir konu olmuştur.
-Türkiye’de uzun yıllardır öğrencilerin ilkokulda aynı öğretmenle
-öğrenime devam etmesi geleneği sürmekte, ancak bazı özel okullar
-tüm sınıflarda farklı sınıf öğretmenlerinin derse girmesi; bazı özel
-okullar ilk iki sınıfta aynı, son iki sınıfta farklı bir sınıf öğretmeninin;
-bazıları ise ilk üç sınıfta aynı, son sınıfta farklı bir sınıf öğretmeninin
-görev yapması şeklinde uygulamalar yapmaktadır. Ayrıca bazı özel
-okullarda belli sınıf düzeylerinde (ör. Dördüncü sınıfta) ve belli bir derste
-(ör. Matematik, fen bilimleri ya da Türkçe vb.) uzmanlaşan sınıf
-öğretmenleri de bulunmaktadır. Sözü edilen farklı modellerin son
-yıllarda özel okul sayısındaki hızlı artış ve rekabet nedeniyle
-gerçekleştiği (Cesur, 2019), ancak devlet okullarında geleneksel modelin
-sürdüğü söylenebilir.
-Dünyada sınıf öğretmenliğinde farklı uzmanlaşma modellerinin
-uygulandığı ve bu modellerin çeşitli şekillerde adlandırıldığı
-görülmektedir. Kanada ve ABD’de geleneksel hale gelen “her yıl
-öğretmen değişmesi” ya da “bir yıllık öğretmen” modeli (Tourigny ve
-diğerleri, 2019) ya da “döngüsel” model (looping) bunlardandır. Çin,
-Danimarka, Finlandiya, Hırvatistan, Hollanda, İsrail, İsveç, İtalya,
-Jamaika, Japonya, Küba ve Rusya’daki ilkokullarda da uygulanan
-döngüsel model (Girgin, 2021; Marušić ve diğerleri, 2020; Tourigny ve
-diğerleri, 2019; Wang ve diğerleri, 2017), Türkiye’deki devlet okullarında
-dört yıllık döngüsel şeklinde uygulanarak geleneksel model haline
-gelmiştir. Bu modelde öğretmen bir grup öğrenciyle en az iki öğretim
-yılı ders yürütmekte, döngü tamamlandığında ise yeni bir sınıfla aynı
-döngüye devam etmektedir (Cistone ve Shneyderman, 2004).
-Döngülerin kaç yıl süreceği ülkeden ülkeye göre değişmekle birlikte,
-genellikle iki ya da üç yıl sürmektedir (Tourigny ve diğerlerleri, 2019).
-Böylece modelin iki yıllık döngüsel, üç yıllık döngüsel, dört yıllık
-döngüsel ve beş yıllık döngüsel şeklinde alt türleri bulunmakta,
-Türkiye’deki devlet okullarında dört yıllık döngüsel şeklinde
-uygulanmaktadır.
-Bunun yanı sıra ders/ konu alanlarını temele alan bütünsel (generalist,
-self-contained) ya da branşlaşmış (departmentalized) modeller de
-bulunmaktadır. Bütünsel modelde, sınıf öğretmenlerinin programda
-bulunan tüm temel derslerde (dil, matematik, fen bilimleri ve sosyal
-bilimler) eşit derecede yetkin olduğu varsayılarak, tüm temel akademik
-konuları (dersleri) öğretmesi esas alınır (Brobst ve diğerleri, 2017).
-Yabancı dil, beden eğitimi, müzik, görsel sanatlar, dini bilgiler, drama vb.
-dersler ise farklı öğretmenler tarafından yürütülür. Bütünsel modelde
-öğretmen; çocuğun zihinsel, duygusal ve fiziksel gelişiminin tüm
-aşamalarını destekleyecek şekilde, “bütün yönleriyle” ilgilenir.
-Öğretmen tüm temel dersleri verdiği için hem anlamlı ve bağlantılı
-öğrenmeyi mümkün kılan sürekliliği elde etmekte; hem de özerkliği
-arttığından daha esnek davranarak, dersler/konular arası bütünleşmeyi
-sağlama imkânı bulmaktadır (Parker ve diğerleri, 2017). Öte yandan
-branşlaşmış modelde, temel konuları öğretme sorumluluğunun iki
-veya daha fazla öğretmen tarafından üstlenilmesi (Ray, 2017),
-öğretmenlerin bir dersi birden fazla sınıfa öğretmesi (Slavin, 1987) ve
-belli bir konu alanında uzmanlaşması söz konusudur (Chan ve Jarman,
-2004). ABD’deki hesap verilebilirlik talepleri (özellikle İngilizce ve
-matematik derslerinde öğrenci başarısının artırılması yönündeki
-baskılar), dördüncü ve beşinci sınıflarda branşlaşmış modelin son
-yıllarda hızla artmasına neden olmuştur (Baroody, 2017).
-Görüldüğü gibi, sınıf öğretmenliğinde uzmanlaşma modelleri temelde
-öğrenci gruplarına ya da öğretilecek derslere göre çeşitlendirilmiştir.
-Öğrenci grupları temele alındığında “her yıl öğretmen değişmesi” ya da
-döngüsel modeller, öğretilecek dersler temele alındığında ise bütünsel
-ya da branşlaşmış modeller ortaya çıkmaktadır. Şekil 1’de uzmanlaşma
-modellerinin sınıflaması sunulmaktadır.""")
+    main()
@@ -1,29 +1,28 @@
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize, sent_tokenize
+import heapq
 import string
 
+from nlp_resources import get_sentence_tokenizer, get_stop_words, punkt_language, stop_words_language
+
+
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
 
 class Summarizer:
     def __init__(self, lang='english'):
         """
         Initializes an instance of the class by setting the language used for text processing
-        and loading the corresponding set of stop words. The natural language toolkit (NLTK)
-        is utilized to download and provide the stop words for the specified language.
-        These stop words are then stored in a private variable for use in text processing
-        tasks such as tokenization and frequency analysis.
+        and picking up the corresponding set of stop words and sentence tokenizer. Both come
+        from the process-wide registry in nlp_resources, which reads them from the local NLTK
+        data once per language, so constructing a Summarizer is cheap and never downloads data.
 
-        :param lang: The language to use for processing text. Defaults to 'english'. The language
-                     should correspond to one for which NLTK can provide stop words.
+        :param lang: The language to use for processing text. Defaults to 'english'. Names that
+                     are not an NLTK language, such as 'turkish-english-summarizer', use the
+                     Turkish stop words and the English sentence tokenizer.
         :type lang: str
         """
         self.__lang = lang
-        self.__stop_words = set(stopwords.words())
-        try:
-            nltk.download('stopwords')
-            self.__stop_words = set(stopwords.words('turkish'))
-        except OSError as e:
-            print('Could not load stopwords file: {}'.format(e))
+        self.__stop_words = get_stop_words(stop_words_language(lang))
+        self.__sentence_tokenizer = get_sentence_tokenizer(punkt_language(lang))
 
     @staticmethod
     def __clean_text(text: str) -> str:
@@ -35,7 +34,7 @@ class Summarizer:
         :return: The cleaned text with no punctuation and all lowercase letters.
         :rtype: str
         """
-        clean_text = text.translate(str.maketrans('', '', string.punctuation)).lower()
+        clean_text = text.translate(PUNCTUATION_TABLE).lower()
         return clean_text
 
     def __word_tokenize(self, text: str) -> list[str]:
@@ -48,40 +47,16 @@ class Summarizer:
         :return: A list of words from the given text, after cleaning and tokenizing.
         :rtype: list[str]
         """
+        from nltk.tokenize import word_tokenize
+
         clean_text = self.__clean_text(text)
-        words = word_tokenize(clean_text)
+        words = word_tokenize(clean_text, preserve_line=True)  # Input is a single sentence already
         return words
 
-    def __create_word_freq_dict(self, text: str) -> dict[str, int]:
-        """
-        Creates a frequency dictionary for words in the given text.
-        The text is first tokenized into words using the __word_tokenize method.
-        Each word is then converted to lowercase and checked against a list of stop words
-        (assumed to be stored in self.__stop_words). Words that are not in the stop words list
-        are counted for their frequency in the text.
-
-        :param text: The text to be analyzed for word frequency.
-        :type text: str
-        :return: A dictionary where keys are words and values are the corresponding frequencies of these words in the text.
-        :rtype: dict
-        """
-        word_freq_dict = {}
-        words = self.__word_tokenize(text)
-        for word in words:
-            word = word.lower()  # Ensure uniform case for counting
-            if word not in self.__stop_words:  # Filter out stop words
-                if word in word_freq_dict:
-                    word_freq_dict[word] += 1  # Increment count for existing word
-                else:
-                    word_freq_dict[word] = 1  # Initialize count for new word
-        return word_freq_dict
-
-    @staticmethod
-    def __sentence_tokenize(text: str) -> list[str]:
+    def __sentence_tokenize(self, text: str) -> list[str]:
         """
         Tokenizes a given string of text into a list of sentences. This method utilizes
-        the sent_tokenize function (which should be imported from a relevant library,
-        typically NLTK or a similar text processing library) to identify sentence boundaries
+        the shared Punkt tokenizer of the instance language to identify sentence boundaries
         and split the text accordingly.
 
         :param text: The text to be split into sentences.
@@ -89,64 +64,139 @@ class Summarizer:
         :return: A list containing the individual sentences from the given text.
         :rtype: list[str]
         """
-        sentence = sent_tokenize(text)
+        sentence = self.__sentence_tokenizer.tokenize(text)
         return sentence
 
-    def __create_sentence_freq_dict(self, text: str) -> dict[str, int]:
+    def __create_word_index(self, sentences: list[str]) -> tuple[dict[str, int], dict[str, list[int]]]:
+        """
+        Builds the word frequency dictionary and the word to sentence index in a single pass.
+        Every sentence is word-tokenized exactly once. Words found in the stop words list
+        (self.__stop_words) are skipped. For the remaining words the frequency over the whole
+        document is counted, and the position of every sentence containing the word is recorded
+        once in the index.
+
+        :param sentences: The sentences of the document, in document order.
+        :type sentences: list[str]
+        :return: A tuple of the word frequency dictionary and a dictionary mapping each word
+                 to the ascending positions of the sentences it occurs in.
+        :rtype: tuple[dict, dict]
+        """
+        word_freq_dict = {}
+        word_index = {}
+        for position, sentence in enumerate(sentences):
+            for word in self.__word_tokenize(sentence):
+                if word in self.__stop_words:  # Filter out stop words
+                    continue
+                word_freq_dict[word] = word_freq_dict.get(word, 0) + 1
+                positions = word_index.setdefault(word, [])
+                if not positions or positions[-1] != position:
+                    positions.append(position)  # Record each sentence only once per word
+        return word_freq_dict, word_index
+
+    def __score_sentences(self, sentences: list[str]) -> list[int]:
+        """
+        Scores every sentence with the total document frequency of the distinct words it contains.
+        The scores are accumulated by walking the word to sentence index built by
+        __create_word_index, so the cost grows with the number of tokens in the document
+        instead of the number of sentences times the size of the vocabulary.
+
+        :param sentences: The sentences of the document, in document order.
+        :type sentences: list[str]
+        :return: The score of each sentence, aligned with the given sentences.
+        :rtype: list[int]
         """
-        Creates a frequency dictionary mapping each sentence in the given text to the total frequency of its words.
-        The method first tokenizes the text into sentences using the __sentence_tokenize method.
-        It then creates a word frequency dictionary for the entire text using the __create_word_freq_dict method.
-        For each sentence, the method calculates the total frequency of all words within that sentence,
-        based on their frequencies in the text.
+        scores = [0] * len(sentences)
+        word_freq_dict, word_index = self.__create_word_index(sentences)
+        for word, positions in word_index.items():
+            freq = word_freq_dict[word]
+            for position in positions:
+                scores[position] += freq  # Add word's frequency to sentence's total frequency
+        return scores
 
-        :param text: The text to be analyzed for sentence frequencies.
-        :type text: str
-        :return: A dictionary where keys are sentences from the text and values are the total frequencies of their words.
-        :rtype: dict
+    @staticmethod
+    def __get_average(scores: list[int]) -> float:
         """
-        sentence_freq_dict = {}
-        sentences = self.__sentence_tokenize(text)  # Tokenize text into sentences
-        word_freq_dict = self.__create_word_freq_dict(text)  # Create a word frequency dictionary for the text
-        for sentence in sentences:
-            sentence = sentence.lower()  # Convert sentence to lowercase to match word frequencies
-            sentence_freq = 0  # Initialize sentence frequency
-            for word, freq in word_freq_dict.items():
-                if word in sentence:
-                    sentence_freq += freq  # Add word's frequency to sentence's total frequency
-            sentence_freq_dict[sentence] = sentence_freq
-        return sentence_freq_dict
-
-    def __get_average(self, text: str) -> float:
-        """
-        Calculates the average frequency of words across all sentences in the provided text.
-        This method first generates a sentence frequency dictionary using the
-        __create_sentence_freq_dict method, where each sentence is mapped to the total frequency
-        of its words. It then calculates the average by summing these total frequencies and
-        dividing by the number of sentences.
-
-        :param text: The text to be analyzed for the average word frequency per sentence.
-        :type text: str
-        :return: The average frequency of words across all sentences in the text.
+        Calculates the average sentence score from the scores computed by __score_sentences.
+
+        :param scores: The score of each sentence in the document.
+        :type scores: list[int]
+        :return: The average score, or 0.0 when the document has no sentences.
         :rtype: float
         """
-        sum_values = 0
-        sentence_freq_dict = self.__create_sentence_freq_dict(text)  # Generate sentence frequency dictionary
-        for sentence in sentence_freq_dict:
-            sum_values += sentence_freq_dict[sentence]  # Sum total frequencies of all sentences
-        average = sum_values / len(sentence_freq_dict)  # Calculate average frequency
-        return average
+        if not scores:
+            return 0.0
+        return sum(scores) / len(scores)
 
     def summarize(self, text: str) -> str:
-        summary = ""
         sentences = self.__sentence_tokenize(text)  # Tokenize text into sentences
-        sentence_freq_dict = self.__create_sentence_freq_dict(text)  # Create a frequency dictionary for sentences
-        average = self.__get_average(text)  # Calculate average frequency of words per sentence
-        for sentence in sentences:
-            # Add sentence to summary if its frequency is significantly higher than the average
-            if (sentence.lower() in sentence_freq_dict) and (sentence_freq_dict[sentence.lower()] > (1.2 * average)):
-                summary += " " + sentence
-        return summary
+        scores = self.__score_sentences(sentences)  # Score every sentence from its own words
+        threshold = 1.2 * self.__get_average(scores)
+        # Add sentence to summary if its frequency is significantly higher than the average
+        return "".join(" " + sentence for sentence, score in zip(sentences, scores) if score > threshold)
+
+    def select(self, text: str, token_budget: int, count_tokens) -> str:
+        """
+        Selects the highest scoring sentences whose model tokens fit in token_budget and returns
+        them in document order. Sentences are popped from a max-heap of their scores, best
+        first; a sentence that does not fit in the remaining budget is skipped, so shorter
+        sentences further down the ranking can still fill the window. A text that fits in the
+        budget is returned whole. When no sentence fits, such as a PDF page without sentence
+        punctuation, the best sentence is returned cut to the budget.
+
+        :param text: The text to select sentences from.
+        :type text: str
+        :param token_budget: The maximum number of model tokens of the selection.
+        :type token_budget: int
+        :param count_tokens: Returns the model token count of every sentence in a list, e.g.
+                             summ.count_tokens.
+        :type count_tokens: Callable[[list[str]], list[int]]
+        :return: The selected sentences joined with spaces.
+        :rtype: str
+        """
+        sentences = self.__sentence_tokenize(text)
+        if not sentences:
+            return ""
+        lengths = count_tokens(sentences)
+        if sum(lengths) <= token_budget:
+            return " ".join(sentences)
+        scores = self.__score_sentences(sentences)
+        heap = [(-score, position) for position, score in enumerate(scores)]  # Earlier sentence wins a tie
+        heapq.heapify(heap)
+        selected = []
+        remaining = token_budget
+        best = heap[0][1]
+        while heap and remaining > 0:
+            _, position = heapq.heappop(heap)
+            if lengths[position] <= remaining:
+                selected.append(position)
+                remaining -= lengths[position]
+        if not selected:
+            return self.__truncate(sentences[best], token_budget, count_tokens)
+        return " ".join(sentences[position] for position in sorted(selected))
+
+    @staticmethod
+    def __truncate(sentence: str, token_budget: int, count_tokens) -> str:
+        """
+        Cuts a sentence after the last whole word that fits in token_budget model tokens. The
+        model tokenizer splits text at whitespace before it splits words into pieces, so the
+        tokens of the sentence are the sum of the tokens of its words.
+
+        :param sentence: The sentence to cut.
+        :type sentence: str
+        :param token_budget: The maximum number of model tokens of the result.
+        :type token_budget: int
+        :param count_tokens: Returns the model token count of every text in a list.
+        :type count_tokens: Callable[[list[str]], list[int]]
+        :return: The leading words of the sentence, at least one.
+        :rtype: str
+        """
+        words = sentence.split()
+        used = 0
+        for stop, length in enumerate(count_tokens(words)):
+            used += length
+            if used > token_budget:
+                return " ".join(words[:max(stop, 1)])
+        return " ".join(words)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+"""
+Content-addressed cache of document summaries.
+
+Entries are keyed by a hash of the uploaded file bytes together with the pipeline and model
+version, so the same document uploaded under another name is a hit and a reused filename
+with new content is a miss. A bounded in-memory LRU sits in front of a persistent table in
+the application SQLite database.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from database import get_connection
+
+
+PIPELINE_VERSION = '1'
+DEFAULT_MAX_ENTRIES = 256
+
+
+def document_key(data: bytes, version: str) -> str:
+    """
+    Returns the cache key of a document.
+
+    :param data: The raw bytes of the uploaded file.
+    :type data: bytes
+    :param version: The pipeline and model version the summary is produced with.
+    :type version: str
+    :return: A hex SHA-256 digest of the version and the file bytes.
+    :rtype: str
+    """
+    digest = hashlib.sha256(version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, db_path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        Creates a cache backed by the summary_cache table of the given SQLite database.
+
+        :param db_path: Path of the SQLite database file.
+        :type db_path: str
+        :param max_entries: How many summaries the in-memory tier keeps.
+        :type max_entries: int
+        """
+        self.__db_path = db_path
+        self.__max_entries = max_entries
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = {'memory': 0, 'db': 0}
+        self.__misses = 0
+
+    def __remember(self, key: str, summary: str) -> None:
+        with self.__lock:
+            self.__entries[key] = summary
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)  # Evict the least recently used entry
+
+    def get(self, key: str) -> str | None:
+        """
+        Looks a summary up in memory first and then in the database. Database hits are
+        promoted to the in-memory tier.
+
+        :param key: A key from document_key.
+        :type key: str
+        :return: The cached summary, or None on a miss.
+        :rtype: str | None
+        """
+        with self.__lock:
+            summary = self.__entries.get(key)
+            if summary is not None:
+                self.__entries.move_to_end(key)
+                self.__hits['memory'] += 1
+                return summary
+        row = get_connection(self.__db_path).execute(
+            'SELECT summary FROM summary_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            with self.__lock:
+                self.__misses += 1
+            return None
+        with self.__lock:
+            self.__hits['db'] += 1
+        self.__remember(key, row[0])
+        return row[0]
+
+    def put(self, key: str, summary: str) -> None:
+        """
+        Stores a summary in both tiers.
+
+        :param key: A key from document_key.
+        :type key: str
+        :param summary: The summary of the document.
+        :type summary: str
+        """
+        conn = get_connection(self.__db_path)
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO summary_cache (key, summary) VALUES (?, ?)', (key, summary))
+        self.__remember(key, summary)
+
+    def stats(self) -> dict:
+        """
+        :return: Hit counts per tier, the miss count and the in-memory tier size.
+        :rtype: dict
+        """
+        with self.__lock:
+            return {
+                'hits': self.__hits['memory'] + self.__hits['db'],
+                'memory_hits': self.__hits['memory'],
+                'db_hits': self.__hits['db'],
+                'misses': self.__misses,
+                'entries': len(self.__entries),
+                'max_entries': self.__max_entries,
+            }
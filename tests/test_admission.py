@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+import metrics
+from admission import AdmissionController, Overloaded
+
+
+def waiting():
+    return metrics.ADMISSION_QUEUE_DEPTH.values.get((), 0)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def acquire_in_thread(admission, admitted, name, cost=None):
+    def run():
+        admitted.append((name, admission.acquire(cost)))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_waiting_requests_are_admitted_in_arrival_order():
+    admission = AdmissionController(max_concurrent=1, wait_timeout=5)
+    ticket = admission.acquire()
+    admitted = []
+    threads = []
+    for count, name in enumerate(('first', 'second', 'third'), start=1):
+        threads.append(acquire_in_thread(admission, admitted, name))
+        wait_until(lambda: waiting() == count)
+
+    for count in range(1, 4):
+        admission.release(ticket)
+        wait_until(lambda: len(admitted) == count)
+        ticket = admitted[-1][1]
+    for thread in threads:
+        thread.join(5)
+
+    assert [name for name, _ in admitted] == ['first', 'second', 'third']
+
+
+def test_request_is_rejected_when_the_queue_is_full():
+    admission = AdmissionController(max_concurrent=1, max_waiting=1, wait_timeout=5)
+    ticket = admission.acquire()
+    admitted = []
+    thread = acquire_in_thread(admission, admitted, 'waiting')
+    wait_until(lambda: waiting() == 1)
+
+    with pytest.raises(Overloaded) as rejected:
+        admission.acquire()
+
+    assert rejected.value.reason == 'queue_full'
+    admission.release(ticket)
+    thread.join(5)
+    assert [name for name, _ in admitted] == ['waiting']
+
+
+def test_request_is_rejected_when_the_wait_times_out():
+    admission = AdmissionController(max_concurrent=1, wait_timeout=0.05, retry_after=7)
+    admission.acquire()
+
+    with pytest.raises(Overloaded) as rejected:
+        admission.acquire()
+
+    assert (rejected.value.reason, rejected.value.retry_after) == ('timeout', 7)
+    assert waiting() == 0
+
+
+def test_request_that_may_not_wait_is_rejected_as_busy():
+    admission = AdmissionController(max_concurrent=1, wait_timeout=5)
+    ticket = admission.acquire()
+    busy = metrics.ADMISSION_REJECTIONS.values.get(('busy',), 0)
+
+    with pytest.raises(Overloaded) as rejected:
+        admission.acquire(wait_timeout=0)
+
+    assert rejected.value.reason == 'busy'
+    assert metrics.ADMISSION_REJECTIONS.values[('busy',)] == busy + 1
+    admission.release(ticket)
+    admission.release(admission.acquire(wait_timeout=0))  # Free capacity is taken without waiting
+
+
+def test_cost_limits_hold_requests_back():
+    admission = AdmissionController(max_concurrent=4, limits={'pages': 10}, wait_timeout=0.05)
+    first = admission.acquire({'pages': 6})
+    admission.acquire({'pages': 4})
+
+    with pytest.raises(Overloaded):
+        admission.acquire({'pages': 1})
+    admission.release(first)
+    admission.acquire({'pages': 5})
+
+
+def test_oversized_request_is_admitted_only_when_idle():
+    admission = AdmissionController(max_concurrent=4, limits={'pages': 10}, wait_timeout=0.05)
+    small = admission.acquire({'pages': 1})
+
+    with pytest.raises(Overloaded):
+        admission.acquire({'pages': 50})
+    admission.release(small)
+    admission.acquire({'pages': 50})
+
+
+def test_releasing_a_ticket_twice_frees_its_capacity_once():
+    admission = AdmissionController(max_concurrent=2, wait_timeout=0.05)
+    first = admission.acquire()
+    admission.acquire()
+    admission.release(first)
+    admission.release(first)
+
+    admission.acquire()
+    with pytest.raises(Overloaded):
+        admission.acquire()
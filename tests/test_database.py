@@ -0,0 +1,100 @@
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+
+import pytest
+
+import database
+
+
+BASELINE_DATABASE = Path(__file__).resolve().parent.parent / database.DEFAULT_DATABASE
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """
+    A copy of the shipped database, at schema version 0 with its articles.
+    """
+    path = tmp_path / 'db.sqlite3'
+    shutil.copyfile(BASELINE_DATABASE, path)
+    conn = sqlite3.connect(path)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == 0
+    conn.close()
+    return path
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    for pragma in database.PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def test_migrates_baseline_database(baseline):
+    conn = connect(baseline)
+    articles = conn.execute('SELECT id, filename, summary FROM articles ORDER BY id').fetchall()
+
+    assert database.migrate(conn) == database.SCHEMA_VERSION
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == database.SCHEMA_VERSION
+    assert conn.execute('SELECT id, filename, summary FROM articles ORDER BY id').fetchall() == articles
+    assert 'timings' in [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+    indexed = conn.execute('SELECT rowid FROM articles_fts ORDER BY rowid').fetchall()
+    assert [row[0] for row in indexed] == [row[0] for row in articles]
+
+
+def test_migrating_again_does_nothing(baseline):
+    database.migrate(connect(baseline))
+
+    assert database.migrate(connect(baseline)) == database.SCHEMA_VERSION
+
+
+def test_failed_migration_rolls_back(baseline, monkeypatch):
+    failing = (database.SCHEMA_VERSION + 1, ('CREATE TABLE partial (id INTEGER)', 'SELECT * FROM missing'))
+    monkeypatch.setattr(database, 'MIGRATIONS', (*database.MIGRATIONS, failing))
+    monkeypatch.setattr(database, 'SCHEMA_VERSION', failing[0])
+    conn = connect(baseline)
+
+    with pytest.raises(sqlite3.OperationalError):
+        database.migrate(conn)
+
+    assert not conn.in_transaction
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == 0
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert 'partial' not in tables and 'articles_fts' not in tables
+    monkeypatch.undo()
+    assert database.migrate(conn) == database.SCHEMA_VERSION
+
+
+def test_concurrent_migrations_apply_once(baseline):
+    barrier = threading.Barrier(4)
+    results = []
+    errors = []
+
+    def run():
+        conn = connect(baseline)
+        barrier.wait()
+        try:
+            results.append(database.migrate(conn))
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert results == [database.SCHEMA_VERSION] * 4
+
+
+def test_search_ignores_control_characters(tmp_path):
+    path = str(tmp_path / 'db.sqlite3')
+    database.save_article('report.pdf', 'Quarterly revenue grew.', path)
+
+    assert database.match_expression('rev\x00enue\x02 \x00') == '"revenue"'
+    assert [row['filename'] for row in database.search_articles('reve\x00nue', path=path)] == ['report.pdf']
+    assert database.search_articles('\x00', path=path) == []
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+import pytest
+
+import summ
+from inference_server import InferenceClient, InferenceServer
+
+
+AUTHKEY = b'test-secret'
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """
+    Replaces the model with one that records the texts of every batch. The first batch blocks
+    until release is set, so later requests queue up behind it.
+    """
+    recorded = []
+    release = threading.Event()
+
+    def generate_summaries_in_process(texts, batch_size=summ.DEFAULT_BATCH_SIZE, max_length=summ.MAX_INPUT_LENGTH):
+        recorded.append(list(texts))
+        if len(recorded) == 1:
+            release.wait(5)
+        return ['summary of ' + text for text in texts]
+
+    monkeypatch.setattr(summ, 'generate_summaries_in_process', generate_summaries_in_process)
+    monkeypatch.setattr(summ, 'count_tokens', lambda texts: [len(text.split()) for text in texts])
+    return recorded, release
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = InferenceServer(str(tmp_path / 'sockets' / 'inference.sock'), AUTHKEY, max_batch_size=8, max_wait=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    wait_until(lambda: os.path.exists(server.address))
+    return server
+
+
+def test_requests_queued_behind_a_batch_are_coalesced(server, batches):
+    recorded, release = batches
+    client = InferenceClient(server.address, AUTHKEY)
+    results = {}
+
+    def request(text):
+        results[text] = client.generate_summaries([text])
+
+    first = threading.Thread(target=request, args=('first',))
+    first.start()
+    wait_until(lambda: len(recorded) == 1)
+    waiting = [threading.Thread(target=request, args=(text,)) for text in ('a', 'b', 'c')]
+    for thread in waiting:
+        thread.start()
+    wait_until(lambda: server._InferenceServer__queue.qsize() == 3)
+    release.set()
+    for thread in [first, *waiting]:
+        thread.join(5)
+
+    assert len(recorded) == 2
+    assert sorted(recorded[1]) == ['a', 'b', 'c']
+    assert results == {text: ['summary of ' + text] for text in ('first', 'a', 'b', 'c')}
@@ -0,0 +1,67 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import database
+import jobs
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'db.sqlite3')
+
+
+@pytest.fixture
+def server(db_path):
+    """
+    Another running server, as its process and the owner it claimed.
+    """
+    process = subprocess.Popen([sys.executable, '-c', 'import jobs, sys, time; '
+                                'print(jobs.claim_ownership(sys.argv[1]), flush=True); time.sleep(60)', db_path],
+                               cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    try:
+        yield process, process.stdout.readline().strip()
+    finally:
+        process.kill()
+        process.wait()
+
+
+def add_job(db_path, job_id, status, owner):
+    conn = database.get_connection(db_path)
+    with conn:
+        conn.execute('INSERT INTO jobs (id, filename, status, owner) VALUES (?, ?, ?, ?)',
+                     (job_id, job_id + '.txt', status, owner))
+
+
+def statuses(db_path):
+    return dict(database.get_connection(db_path).execute('SELECT id, status FROM jobs').fetchall())
+
+
+def test_fail_interrupted_fails_only_jobs_of_gone_servers(db_path, server):
+    _, live = server
+    add_job(db_path, 'live', jobs.RUNNING, live)
+    add_job(db_path, 'gone', jobs.QUEUED, 'a' * 32)
+    add_job(db_path, 'unowned', jobs.RUNNING, None)
+    add_job(db_path, 'finished', jobs.DONE, 'a' * 32)
+
+    assert jobs.JobQueue(db_path).fail_interrupted() == 2
+
+    assert statuses(db_path) == {'live': jobs.RUNNING, 'gone': jobs.FAILED, 'unowned': jobs.FAILED,
+                                 'finished': jobs.DONE}
+
+
+def test_owner_is_gone_once_its_server_exits(db_path, server):
+    process, owner = server
+    add_job(db_path, 'job', jobs.RUNNING, owner)
+    assert jobs.JobQueue(db_path).fail_interrupted() == 0
+
+    process.kill()
+    process.wait()
+
+    assert jobs.JobQueue(db_path).fail_interrupted() == 1
+    assert statuses(db_path) == {'job': jobs.FAILED}
@@ -0,0 +1,100 @@
+import pytest
+
+import nlp_resources
+import summ
+
+
+class SentenceTokenizer:
+    def tokenize(self, text):
+        return [sentence if sentence.endswith('.') else sentence + '.'
+                for sentence in text.split('. ') if sentence.strip()]
+
+
+@pytest.fixture(autouse=True)
+def words_as_tokens(monkeypatch):
+    """
+    Splits sentences at '. ' and counts every word as one model token, so no NLTK data or
+    tokenizer is needed.
+    """
+    monkeypatch.setattr(nlp_resources, 'get_sentence_tokenizer', lambda language: SentenceTokenizer())
+    monkeypatch.setattr(summ, 'count_tokens', lambda texts: [len(text.split()) for text in texts])
+
+
+def sentences(count, words=3):
+    return ['{} {}.'.format(index, ' '.join(['w'] * (words - 1))) for index in range(count)]
+
+
+def test_chunks_stay_within_chunk_tokens():
+    text = ' '.join(sentences(6))
+
+    chunks = summ.split_into_chunks(text, chunk_tokens=7, overlap_tokens=0)
+
+    assert chunks == [' '.join(sentences(6)[start:start + 2]) for start in (0, 2, 4)]
+
+
+def test_chunks_start_with_the_overlap_of_the_previous_chunk():
+    parts = sentences(5)
+
+    chunks = summ.split_into_chunks(' '.join(parts), chunk_tokens=9, overlap_tokens=3)
+
+    assert chunks == [' '.join(parts[0:3]), ' '.join(parts[2:5])]
+    assert all(len(chunk.split()) <= 9 for chunk in chunks)
+
+
+def test_long_sentence_is_a_chunk_of_its_own():
+    parts = [*sentences(1), *sentences(1, words=12), *sentences(1)]
+
+    assert summ.split_into_chunks(' '.join(parts), chunk_tokens=7, overlap_tokens=2) == parts
+
+
+@pytest.mark.parametrize('overlap_tokens', [-1, 7, 8])
+def test_overlap_must_be_smaller_than_chunk(overlap_tokens):
+    with pytest.raises(ValueError):
+        summ.split_into_chunks(' '.join(sentences(3)), chunk_tokens=7, overlap_tokens=overlap_tokens)
+
+
+@pytest.fixture
+def generate(monkeypatch):
+    """
+    Summarizes every chunk as the three-word sentence 'summary of <first word>.' and records
+    the chunks of every call.
+    """
+    calls = []
+
+    def generate_summaries(chunks, batch_size=summ.DEFAULT_BATCH_SIZE):
+        calls.append(list(chunks))
+        return ['summary of {}.'.format(chunk.split()[0].rstrip('.')) for chunk in chunks]
+
+    monkeypatch.setattr(summ, 'generate_summaries', generate_summaries)
+    return calls
+
+
+def test_long_summary_of_one_chunk_is_not_reduced(generate):
+    assert summ.generate_long_summary(' '.join(sentences(2)), chunk_tokens=7, overlap_tokens=0) == 'summary of 0.'
+    assert len(generate) == 1
+
+
+def test_long_summary_reduces_partials_up_to_max_depth(generate):
+    text = ' '.join(sentences(8))
+
+    summary = summ.generate_long_summary(text, chunk_tokens=7, overlap_tokens=0, max_depth=1)
+
+    assert len(generate[0]) == 4  # Map: two sentences per chunk
+    assert generate[1] == ['summary of 0. summary of 2.', 'summary of 4. summary of 6.']  # One reduce pass
+    assert summary == 'summary of summary. summary of summary.'
+    assert len(generate) == 2
+
+
+def test_long_summary_without_reduce_joins_partials(generate):
+    summary = summ.generate_long_summary(' '.join(sentences(4)), chunk_tokens=7, overlap_tokens=0, max_depth=0)
+
+    assert summary == 'summary of 0. summary of 2.'
+    assert len(generate) == 1
+
+
+def test_long_summary_reduces_until_one_partial_remains(generate):
+    summary = summ.generate_long_summary(' '.join(sentences(4)), chunk_tokens=7, overlap_tokens=0, max_depth=5)
+
+    assert generate[1] == ['summary of 0. summary of 2.']
+    assert summary == 'summary of summary.'
+    assert len(generate) == 2
@@ -0,0 +1,65 @@
+import pytest
+
+import summarize
+from summarize import Summarizer
+
+
+# Word frequencies: apple 3, banana 2, cherry 2, date 1. Sentence scores: 5, 2, 7 and 1.
+TEXT = 'apple banana. cherry. apple banana apple cherry. date.'
+SENTENCES = ['apple banana.', 'cherry.', 'apple banana apple cherry.', 'date.']
+
+
+class SentenceTokenizer:
+    def tokenize(self, text):
+        return [sentence if sentence.endswith('.') else sentence + '.'
+                for sentence in text.split('. ') if sentence.strip()]
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    """
+    A Summarizer that splits sentences at '. ' and has no stop words, so no NLTK data is needed.
+    """
+    monkeypatch.setattr(summarize, 'get_sentence_tokenizer', lambda language: SentenceTokenizer())
+    monkeypatch.setattr(summarize, 'get_stop_words', lambda language: frozenset())
+    return Summarizer()
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+def test_text_within_budget_is_returned_whole(summarizer):
+    assert summarizer.select(TEXT, 8, count_words) == ' '.join(SENTENCES)
+
+
+@pytest.mark.parametrize('budget, expected', [
+    (6, [0, 2]),
+    (5, [1, 2]),  # The second best sentence does not fit; shorter ones fill the budget
+    (3, [0, 1]),  # The best sentence does not fit at all
+])
+def test_best_sentences_are_selected_in_document_order(summarizer, budget, expected):
+    selection = summarizer.select(TEXT, budget, count_words)
+
+    assert selection == ' '.join(SENTENCES[position] for position in expected)
+    assert sum(count_words([selection])) <= budget
+
+
+def test_empty_text_selects_nothing(summarizer):
+    assert summarizer.select('', 8, count_words) == ''
+
+
+def test_best_sentence_is_cut_when_no_sentence_fits(summarizer):
+    text = 'apple banana cherry date. banana cherry date elder.'
+
+    assert summarizer.select(text, 2, count_words) == 'apple banana'  # Tied scores: the earlier sentence
+
+
+def test_cut_keeps_only_whole_words(summarizer):
+    def two_tokens_per_word(texts):
+        return [2 * len(text.split()) for text in texts]
+
+    text = 'apple banana cherry date.'
+
+    assert summarizer.select(text, 5, two_tokens_per_word) == 'apple banana'
+    assert summarizer.select(text, 1, two_tokens_per_word) == 'apple'  # At least one word